@@ -1,10 +1,7 @@
 import arviz as az
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import estival.priors as esp
-from numpyro import distributions as dist
-from scipy.stats import truncnorm, gaussian_kde
 
 
 def convert_prior_to_numpyro(prior):
@@ -17,6 +14,9 @@ def convert_prior_to_numpyro(prior):
     Returns:
         A tuple of (Numpyro distribution, bounds).
     """
+    # Imported here, as numpyro is slow to import and only needed for the conversion
+    from numpyro import distributions as dist
+
     if isinstance(prior, esp.UniformPrior):
         return dist.Uniform(low=prior.start, high=prior.end), (prior.start, prior.end)
     elif isinstance(prior, esp.TruncNormalPrior):
@@ -121,6 +121,10 @@ def plot_post_prior_comparison(idata, priors, params_name):
     Returns:
         The figure object.
     """
+    # Imported here, as matplotlib and scipy are slow to import and only needed for plotting
+    import matplotlib.pyplot as plt
+    from scipy.stats import gaussian_kde
+
     # Filter priors to exclude those containing '_dispersion'
     req_vars = [
         var
@@ -206,6 +210,9 @@ def plot_trace(idata: az.InferenceData, params_name: dict):
     Returns:
         A Matplotlib figure object containing the trace plots.
     """
+    # Imported here, as matplotlib is slow to import and only needed for plotting
+    import matplotlib.pyplot as plt
+
     # Filter out parameters containing '_dispersion' and 'contact_reduction'
     filtered_posterior = idata.posterior.drop_vars(
         [
@@ -250,6 +257,9 @@ def calculate_derived_metrics(death_rate, recovery_rate, natural_death_rate):
 
 def sample_truncated_normal(mean, stdev, trunc_range, num_samples=1000000):
     """Sample from a truncated normal distribution."""
+    # Imported here, as scipy is slow to import and only needed for the sampling
+    from scipy.stats import truncnorm
+
     a, b = (trunc_range[0] - mean) / stdev, (trunc_range[1] - mean) / stdev
     return truncnorm(a, b, loc=mean, scale=stdev).rvs(num_samples)
 
@@ -349,6 +359,10 @@ def plot_derived_comparison(prior_metrics, posterior_metrics):
     Returns:
         Displays the figure and prints the derived metrics table (mean, 2.5% and 97.5% quantiles).
     """
+    # Imported here, as matplotlib and scipy are slow to import and only needed for plotting
+    import matplotlib.pyplot as plt
+    from scipy.stats import gaussian_kde
+
     # Derived parameters to compare
     derived_vars = [
         "duration_positive",
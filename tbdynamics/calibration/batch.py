@@ -0,0 +1,272 @@
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Iterator, List, Callable, Tuple
+from weakref import WeakKeyDictionary
+import numpy as np
+import pandas as pd
+import jax
+from jax import numpy as jnp
+from estival.model import BayesianCompartmentalModel
+from estival.sampling import tools as esamp
+
+
+# Compiled batch runners for each model, so that repeated batched runs don't recompile
+_batch_runner_cache = WeakKeyDictionary()
+
+
+@dataclass
+class BatchResults:
+    values: np.ndarray  # (sample, time, output)
+    index: pd.Index  # sample index, as in the input samples
+    times: pd.Index
+    outputs: List[str]
+
+
+def get_result_times(bcm: BayesianCompartmentalModel) -> pd.Index:
+    """
+    Gets the times of the model results, as used by estival to index the results and
+    evaluate the targets.
+
+    Args:
+        bcm: The Bayesian compartmental model.
+
+    Returns:
+        The result times.
+    """
+    return pd.Index(bcm.model.get_output_times())
+
+
+def get_runtime_params(bcm: BayesianCompartmentalModel, samples) -> List[str]:
+    """
+    Gets the model parameters without priors that are set for each sample (e.g. the improved
+    detection scale-up parameters of a model built with runtime_detection=True), which estival's
+    runners hold fixed at their values in bcm.parameters.
+
+    Args:
+        bcm: The Bayesian compartmental model.
+        samples: Any sample container accepted by bcm.sample.convert.
+
+    Returns:
+        Sorted names of the runtime parameters.
+    """
+    sample_params = set(bcm.sample.convert(samples).components)
+    return sorted(bcm.model.get_input_parameters().intersection(sample_params) - set(bcm.priors))
+
+
+def get_dynamic_params(
+    bcm: BayesianCompartmentalModel, runtime_params: List[str] = ()
+) -> List[str]:
+    """
+    Gets the parameters that vary between samples, i.e. the model parameters with priors
+    (matching estival's choice of dynamic parameters for the BayesianCompartmentalModel runners),
+    along with any runtime parameters.
+
+    Args:
+        bcm: The Bayesian compartmental model.
+        runtime_params: Model parameters without priors to vary too (see get_runtime_params).
+
+    Returns:
+        Sorted names of the dynamic parameters.
+    """
+    prior_params = bcm.model.get_input_parameters().intersection(bcm.priors)
+    return sorted(prior_params.union(runtime_params))
+
+
+def get_batch_runner(
+    bcm: BayesianCompartmentalModel,
+    outputs: List[str] = None,
+    solver: str = None,
+    runtime_params: List[str] = (),
+) -> Tuple[Callable, List[str], List[str]]:
+    """
+    Builds a compiled function running the model for a stacked array of parameter vectors
+    under jax.vmap, rather than one sample at a time through Python.
+    Runners are cached per model, set of outputs and runtime parameters.
+
+    Args:
+        bcm: The Bayesian compartmental model to run; parameters without priors are frozen
+            at the values in bcm.parameters.
+        outputs: Derived outputs to calculate (and their dependencies); all saved outputs if None.
+        solver: summer2 solver for the batched runs; the model's own solver (as used for the
+            per-sample runs) if None. Under jax.vmap the adaptive solver steps every sample of
+            a chunk at the smallest step of any of them, so batched runs of the Vietnam model
+            were 2.5-3 times slower than per-sample runs. "euler" steps on the model's time
+            grid were 1.6-1.7 times faster, but their outputs after 1950 differ from the
+            per-sample runs by up to about 2% (see benchmark_batch_runner), so they have to be
+            asked for. rk4 diverges at the model's time step.
+        runtime_params: Model parameters without priors to vary between samples too (see
+            get_runtime_params); otherwise they are frozen with the other fixed parameters.
+
+    Returns:
+        The batch function (mapping a (sample, parameter) array to a (sample, time, output)
+        array), the parameter names in column order and the output names in the last axis.
+    """
+    model_runners = _batch_runner_cache.setdefault(bcm, {})
+    cache_key = (tuple(outputs) if outputs else None, solver, tuple(runtime_params))
+    if cache_key in model_runners:
+        return model_runners[cache_key]
+
+    model = bcm.model
+    dyn_params = get_dynamic_params(bcm, runtime_params)
+
+    # Only calculate the requested outputs, or those the model saves
+    runner = model.get_runner(
+        bcm.parameters,
+        dyn_params,
+        jit=False,
+        include_full_outputs=False,
+        derived_outputs=outputs,
+        solver=solver,
+    )
+    run_func = runner.function
+
+    if outputs is None:
+        example_params = {p: jax.ShapeDtypeStruct((), jnp.float64) for p in dyn_params}
+        outputs = sorted(jax.eval_shape(run_func, example_params)["derived_outputs"])
+
+    def run_stacked(param_vector):
+        parameters = {p: param_vector[i] for i, p in enumerate(dyn_params)}
+        derived_outputs = run_func(parameters)["derived_outputs"]
+        return jnp.stack([derived_outputs[o] for o in outputs], axis=-1)
+
+    model_runners[cache_key] = jax.jit(jax.vmap(run_stacked)), dyn_params, list(outputs)
+    return model_runners[cache_key]
+
+
+def iter_samples_batched(
+    bcm: BayesianCompartmentalModel,
+    samples,
+    chunk_size: int = 100,
+    outputs: List[str] = None,
+    solver: str = None,
+) -> Iterator[Tuple[pd.Index, np.ndarray]]:
+    """
+    Runs the model for the samples in vectorised chunks, yielding the results of each chunk
+    as soon as it has been run, so that they can be summarised without holding the results
+    of all the samples at once.
+    The last chunk is padded to chunk_size, so the model is only compiled once.
+    Model parameters without priors that are set in the samples (see get_runtime_params) are
+    varied between the samples too.
+
+    Args:
+        bcm: The Bayesian compartmental model to run.
+        samples: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        chunk_size: Number of samples evaluated in each vectorised call.
+        outputs: Derived outputs to return; all saved outputs if None.
+        solver: summer2 solver for the batched runs; see get_batch_runner.
+
+    Yields:
+        The sample index and the (sample, time, output) results of each chunk, in the order
+        of the input samples.
+    """
+    samples = bcm.sample.convert(samples)
+    runtime_params = get_runtime_params(bcm, samples)
+    batch_func, dyn_params, outputs = get_batch_runner(bcm, outputs, solver, runtime_params)
+    param_array = np.column_stack([samples.components[p] for p in dyn_params]).astype(float)
+
+    n_samples = len(param_array)
+    for start in range(0, n_samples, chunk_size):
+        chunk = param_array[start : start + chunk_size]
+        n_chunk = len(chunk)
+        if n_chunk < chunk_size:
+            chunk = np.concatenate([chunk, np.repeat(chunk[-1:], chunk_size - n_chunk, axis=0)])
+        yield samples.index[start : start + n_chunk], np.asarray(batch_func(chunk))[:n_chunk]
+
+
+def run_samples_batched(
+    bcm: BayesianCompartmentalModel,
+    samples,
+    chunk_size: int = 100,
+    outputs: List[str] = None,
+    solver: str = None,
+) -> BatchResults:
+    """
+    Runs the model for all the samples (e.g. an extracted posterior) in vectorised chunks.
+    The last chunk is padded to chunk_size, so the model is only compiled once.
+
+    Args:
+        bcm: The Bayesian compartmental model to run.
+        samples: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        chunk_size: Number of samples evaluated in each vectorised call.
+        outputs: Derived outputs to return; all saved outputs if None.
+        solver: summer2 solver for the batched runs; see get_batch_runner.
+
+    Returns:
+        The results for every sample, in the order of the input samples.
+    """
+    samples = bcm.sample.convert(samples)
+    _, _, outputs = get_batch_runner(bcm, outputs, solver, get_runtime_params(bcm, samples))
+
+    times = get_result_times(bcm)
+    values = np.empty((len(samples.index), len(times), len(outputs)))
+    start = 0
+    for chunk_index, chunk_values in iter_samples_batched(
+        bcm, samples, chunk_size, outputs, solver
+    ):
+        values[start : start + len(chunk_index)] = chunk_values
+        start += len(chunk_index)
+
+    return BatchResults(values, samples.index, times, outputs)
+
+
+def batch_results_to_df(batch_results: BatchResults) -> pd.DataFrame:
+    """
+    Converts batched results to the layout returned by esamp.model_results_for_samples,
+    so they can be passed on to esamp.quantiles_for_results and the plotting functions.
+
+    Args:
+        batch_results: Results from run_samples_batched.
+
+    Returns:
+        DataFrame with time as index and (variable, sample) as columns.
+    """
+    n_samples, n_times, n_outputs = batch_results.values.shape
+    sample_index = batch_results.index
+    if not isinstance(sample_index, pd.MultiIndex):
+        sample_index = pd.MultiIndex.from_arrays(
+            [sample_index], names=[sample_index.name or "sample"]
+        )
+    columns = pd.MultiIndex.from_tuples(
+        [(output, *idx) for output in batch_results.outputs for idx in sample_index],
+        names=["variable", *sample_index.names],
+    )
+    data = batch_results.values.transpose(1, 2, 0).reshape(n_times, n_outputs * n_samples)
+    return pd.DataFrame(data, index=pd.Index(batch_results.times, name="time"), columns=columns)
+
+
+def benchmark_batch_runner(
+    bcm: BayesianCompartmentalModel,
+    samples,
+    chunk_sizes: List[int] = [50, 100, 250],
+    solver: str = None,
+) -> pd.DataFrame:
+    """
+    Compares the run time of the batched runner against the per-sample estival path,
+    once both have been compiled.
+
+    Args:
+        bcm: The Bayesian compartmental model to run.
+        samples: Any sample container accepted by bcm.sample.convert.
+        chunk_sizes: Chunk sizes to time for the batched runner.
+        solver: summer2 solver for the batched runs; see get_batch_runner.
+
+    Returns:
+        DataFrame of run times (seconds) and speed-up relative to the per-sample path.
+    """
+    samples = bcm.sample.convert(samples)
+
+    # Warm up the per-sample runner, then time it
+    esamp.model_results_for_samples(samples[samples.index[:1]], bcm, include_extras=False)
+    start = perf_counter()
+    esamp.model_results_for_samples(samples, bcm, include_extras=False)
+    timings = {"per_sample": perf_counter() - start}
+
+    for chunk_size in chunk_sizes:
+        run_samples_batched(bcm, samples[samples.index[:chunk_size]], chunk_size, solver=solver)
+        start = perf_counter()
+        run_samples_batched(bcm, samples, chunk_size, solver=solver)
+        timings[f"batched_{chunk_size}"] = perf_counter() - start
+
+    timings = pd.Series(timings, name="seconds").to_frame()
+    timings["speed_up"] = timings.loc["per_sample", "seconds"] / timings["seconds"]
+    return timings
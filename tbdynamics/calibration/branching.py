@@ -0,0 +1,393 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from weakref import WeakKeyDictionary
+import numpy as np
+import pandas as pd
+import jax
+from jax import numpy as jnp
+from estival.model import BayesianCompartmentalModel
+
+from tbdynamics.calibration.batch import (
+    BatchResults,
+    get_dynamic_params,
+    get_result_times,
+    get_runtime_params,
+)
+
+
+# Branching runners for each model, so that segment solvers are only compiled once
+_branch_runner_cache = WeakKeyDictionary()
+
+
+@dataclass
+class StateSnapshot:
+    time: float
+    index: pd.Index  # sample index, as in the input samples
+    trajectories: np.ndarray  # (sample, time, compartment), model start to snapshot time
+    params: Dict[str, float] = field(default_factory=dict)  # applied to every sample
+
+    @property
+    def values(self) -> np.ndarray:
+        """Compartment values of each sample at the snapshot time."""
+        return self.trajectories[:, -1]
+
+
+@dataclass
+class ScenarioBranch:
+    name: str
+    branch_time: float  # time from which the branch departs from its parent
+    params: Dict[str, float] = field(default_factory=dict)  # changes relative to the parent
+    children: List["ScenarioBranch"] = field(default_factory=list)
+
+
+class BranchRunner:
+    """
+    Runs a model in time segments restarted from saved compartment values, so that
+    scenarios which only differ after a branch time share the integration before it.
+    The parameters varied between samples or branches are those with priors and the
+    runtime parameters (e.g. the improved detection scale-up parameters).
+    Each segment of a trajectory, and the derived outputs over its times, use that segment's
+    own parameters, so a branch's parameters only act from its branch time.
+    """
+
+    def __init__(
+        self,
+        bcm: BayesianCompartmentalModel,
+        outputs: List[str] = None,
+        runtime_params: List[str] = (),
+    ):
+        model = bcm.model
+        self.bcm = bcm
+        self.times = np.asarray(model.times)
+        self.dyn_params = get_dynamic_params(bcm, runtime_params)
+        input_params = model.get_input_parameters()
+        self.base_params = {k: v for k, v in bcm.parameters.items() if k in input_params}
+
+        # Only calculate the requested outputs (or those the model saves)
+        runner = model.get_runner(
+            bcm.parameters, self.dyn_params, jit=False, derived_outputs=outputs
+        )
+        self._impl_dict = runner.impl_dict
+        self._segment_funcs = {}
+
+        get_flow_rates = jax.vmap(self._impl_dict["get_flow_rates"], in_axes=(0, 0, None, None))
+
+        def calc_model_variables(parameters, comp_vals):
+            static_graph_vals = self._impl_dict["static_graph_func"](parameters=parameters)
+            model_data = self._impl_dict["get_model_data"](parameters)
+            flows, computed_values = get_flow_rates(
+                comp_vals, jnp.array(self.times), static_graph_vals, model_data
+            )
+            return {"outputs": comp_vals, "flows": flows, "computed_values": computed_values}
+
+        def calc_derived_outputs(parameters, model_variables):
+            return self._impl_dict["calc_derived_outputs"](
+                parameters=self.base_params | parameters, model_variables=model_variables
+            )
+
+        def calc_outputs(parameters, comp_vals):
+            return calc_derived_outputs(parameters, calc_model_variables(parameters, comp_vals))
+
+        def calc_initial_pop(parameters):
+            static_graph_vals = self._impl_dict["static_graph_func"](parameters=parameters)
+            return self._impl_dict["calc_initial_pop"](static_graph_vals)
+
+        self._calc_model_variables = jax.jit(calc_model_variables)
+        self._calc_derived_outputs = jax.jit(calc_derived_outputs)
+        self._calc_initial_pop = jax.jit(calc_initial_pop)
+        self.outputs = outputs or sorted(
+            jax.eval_shape(
+                calc_outputs,
+                {p: jax.ShapeDtypeStruct((), jnp.float64) for p in self.dyn_params},
+                jax.ShapeDtypeStruct((len(self.times), len(model.compartments)), jnp.float64),
+            )
+        )
+
+    def get_time_idx(self, time: float) -> int:
+        """
+        Gets the index of a branch time in the model's time grid.
+
+        Args:
+            time: The branch time, which must be one of the model's output times.
+
+        Returns:
+            The index of the time in the model times.
+        """
+        idx = int(np.argmin(np.abs(self.times - time)))
+        if not np.isclose(self.times[idx], time):
+            raise ValueError(f"Branch time {time} is not one of the model output times")
+        return idx
+
+    def _get_segment_func(self, start_idx: int, end_idx: int):
+        key = (start_idx, end_idx)
+        if key not in self._segment_funcs:
+            times = jnp.array(self.times[start_idx : end_idx + 1])
+
+            def run_segment(parameters, start_values):
+                static_graph_vals = self._impl_dict["static_graph_func"](parameters=parameters)
+                model_data = self._impl_dict["get_model_data"](parameters)
+                return self._impl_dict["get_ode_solution"](
+                    start_values, times, static_graph_vals, model_data
+                )
+
+            self._segment_funcs[key] = jax.jit(run_segment)
+        return self._segment_funcs[key]
+
+    def run_segment(
+        self, parameters: Dict[str, float], trajectory: np.ndarray, end_idx: int
+    ) -> np.ndarray:
+        """
+        Continues a trajectory from its last time point to a later point in the time grid.
+
+        Args:
+            parameters: Dynamic parameter values for the segment.
+            trajectory: Compartment values from the model start, or None to start from
+                the initial population.
+            end_idx: Index of the last time of the segment in the model times.
+
+        Returns:
+            The trajectory extended to end_idx.
+        """
+        if trajectory is None:
+            trajectory = np.asarray(self._calc_initial_pop(parameters))[None]
+        start_idx = len(trajectory) - 1
+        if end_idx <= start_idx:
+            return trajectory[: end_idx + 1]
+        segment = self._get_segment_func(start_idx, end_idx)(parameters, trajectory[-1])
+        return np.concatenate([trajectory, np.asarray(segment)[1:]])
+
+    def _stitch(self, segment_starts: List[int], segment_values: List[dict]) -> dict:
+        # Take the rows from each segment's start time onwards from that segment's values
+        segment_idx = np.searchsorted(segment_starts, np.arange(len(self.times)), side="right") - 1
+        return jax.tree_util.tree_map(
+            lambda *values: np.choose(
+                segment_idx.reshape(-1, *[1] * (np.ndim(values[0]) - 1)), values
+            ),
+            *segment_values,
+        )
+
+    def calc_outputs(
+        self, segments: List[Tuple[int, Dict[str, float]]], trajectory: np.ndarray
+    ) -> np.ndarray:
+        """
+        Calculates the derived outputs for a complete trajectory, with the flows and
+        derived outputs at each time calculated with the parameters of the segment that
+        time belongs to.
+
+        Args:
+            segments: The index of the first model time of each segment of the trajectory
+                (starting with 0, in order), with the dynamic parameter values of the segment.
+            trajectory: Compartment values over all the model times.
+
+        Returns:
+            Array of the derived outputs over the model's output times, with outputs in the
+            last axis.
+        """
+        segment_starts = [start_idx for start_idx, _ in segments]
+        model_variables = self._stitch(
+            segment_starts,
+            [self._calc_model_variables(p, trajectory) for _, p in segments],
+        )
+        derived_outputs = self._stitch(
+            segment_starts,
+            [self._calc_derived_outputs(p, model_variables) for _, p in segments],
+        )
+        values = np.stack([np.asarray(derived_outputs[o]) for o in self.outputs], axis=-1)
+        # Only keep the model's output times, if it records a subset of its times
+        output_idx = getattr(self.bcm.model, "_output_idx", None)
+        return values if output_idx is None else values[output_idx]
+
+
+def get_branch_runner(
+    bcm: BayesianCompartmentalModel, outputs: List[str] = None, runtime_params: List[str] = ()
+) -> BranchRunner:
+    """
+    Gets the (cached) branching runner for a model, set of outputs and runtime parameters.
+
+    Args:
+        bcm: The Bayesian compartmental model to run.
+        outputs: Derived outputs to calculate (and their dependencies); all saved outputs if None.
+        runtime_params: Model parameters without priors to vary between samples or branches.
+
+    Returns:
+        The branching runner.
+    """
+    model_runners = _branch_runner_cache.setdefault(bcm, {})
+    cache_key = (tuple(outputs) if outputs else None, tuple(runtime_params))
+    if cache_key not in model_runners:
+        model_runners[cache_key] = BranchRunner(bcm, outputs, runtime_params)
+    return model_runners[cache_key]
+
+
+def _get_branch_runtime_params(
+    bcm: BayesianCompartmentalModel, samples, branch_params: List[Dict[str, float]]
+) -> List[str]:
+    # Runtime parameters set by the samples or by any of the branches
+    branch_keys = set().union(*branch_params)
+    model_params = bcm.model.get_input_parameters()
+    return sorted(
+        set(get_runtime_params(bcm, samples)).union(
+            branch_keys.intersection(model_params).difference(bcm.priors)
+        )
+    )
+
+
+def _get_sample_params(bcm: BayesianCompartmentalModel, samples, dyn_params: List[str]):
+    # Runtime parameters not set by the samples start from their values in bcm.parameters
+    samples = bcm.sample.convert(samples)
+    missing = set(dyn_params).difference(samples.components, bcm.parameters)
+    if missing:
+        raise KeyError(f"Samples have no values for {sorted(missing)}, see set_sample_params")
+    sample_params = [
+        {
+            p: float(samples.components[p][i] if p in samples.components else bcm.parameters[p])
+            for p in dyn_params
+        }
+        for i in range(samples.clen)
+    ]
+    return samples.index, sample_params
+
+
+def take_state_snapshots(
+    bcm: BayesianCompartmentalModel,
+    samples,
+    snapshot_time: float,
+    params: Dict[str, float] = None,
+) -> StateSnapshot:
+    """
+    Integrates the model for each sample up to a branch time and saves the compartment values.
+
+    Args:
+        bcm: The Bayesian compartmental model to run.
+        samples: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        snapshot_time: Time of the snapshot, which must be one of the model's output times.
+        params: Parameter values to apply to every sample.
+
+    Returns:
+        The snapshot, including the trajectories up to the snapshot time.
+    """
+    params = params or {}
+    branch_runner = get_branch_runner(
+        bcm, runtime_params=_get_branch_runtime_params(bcm, samples, [params])
+    )
+    end_idx = branch_runner.get_time_idx(snapshot_time)
+    index, sample_params = _get_sample_params(bcm, samples, branch_runner.dyn_params)
+    trajectories = np.stack(
+        [branch_runner.run_segment(p | params, None, end_idx) for p in sample_params]
+    )
+    return StateSnapshot(snapshot_time, index, trajectories, params)
+
+
+def run_branches_from_snapshot(
+    bcm: BayesianCompartmentalModel,
+    samples,
+    snapshot: StateSnapshot,
+    branch_params: Dict[str, Dict[str, float]],
+    outputs: List[str] = None,
+) -> Dict[str, BatchResults]:
+    """
+    Restarts any number of scenarios from saved compartment values and runs them to the end
+    of the model time, so that the integration before the snapshot is not repeated.
+    The scenario parameters only apply from the snapshot time; earlier times keep the
+    parameters the snapshot was taken with.
+
+    Args:
+        bcm: The Bayesian compartmental model to run.
+        samples: The samples that the snapshot was taken for.
+        snapshot: The saved state from take_state_snapshots.
+        branch_params: Parameter values applied to every sample for each scenario, by name.
+        outputs: Derived outputs to return; all saved outputs if None.
+
+    Returns:
+        The results of each scenario, by name.
+    """
+    runtime_params = _get_branch_runtime_params(
+        bcm, samples, [snapshot.params, *branch_params.values()]
+    )
+    branch_runner = get_branch_runner(bcm, outputs, runtime_params)
+    index, sample_params = _get_sample_params(bcm, samples, branch_runner.dyn_params)
+    if not index.equals(snapshot.index):
+        raise ValueError("Samples do not match those of the snapshot")
+
+    end_idx = len(branch_runner.times) - 1
+    snapshot_idx = branch_runner.get_time_idx(snapshot.time)
+    results = {}
+    for name, params in branch_params.items():
+        values = []
+        for sample_p, trajectory in zip(sample_params, snapshot.trajectories):
+            full_trajectory = branch_runner.run_segment(sample_p | params, trajectory, end_idx)
+            segments = [(0, sample_p | snapshot.params), (snapshot_idx, sample_p | params)]
+            values.append(branch_runner.calc_outputs(segments, full_trajectory))
+        results[name] = BatchResults(
+            np.stack(values), index, get_result_times(bcm), branch_runner.outputs
+        )
+    return results
+
+
+def run_scenario_tree(
+    bcm: BayesianCompartmentalModel,
+    samples,
+    tree: List[ScenarioBranch],
+    outputs: List[str] = None,
+) -> Dict[Tuple[str, ...], BatchResults]:
+    """
+    Runs a tree of scenarios, integrating each shared prefix once.
+    Each branch inherits its parent's parameters and trajectory up to its branch time, and
+    is only integrated as far as its latest child's branch time (or to the end for leaves).
+    A branch's parameter changes only apply from its branch time, for both the integration
+    and the derived outputs.
+    For example, COVID configurations branching in 2020 can each have detection scale-up
+    scenarios branching in 2025.
+
+    Args:
+        bcm: The Bayesian compartmental model to run.
+        samples: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        tree: The top-level branches, which depart from the trunk run with the sample values.
+        outputs: Derived outputs to return; all saved outputs if None.
+
+    Returns:
+        The results of each leaf scenario, keyed by the names along its path in the tree.
+    """
+    def get_tree_params(branches):
+        return [p for b in branches for p in [b.params, *get_tree_params(b.children)]]
+
+    runtime_params = _get_branch_runtime_params(bcm, samples, get_tree_params(tree))
+    branch_runner = get_branch_runner(bcm, outputs, runtime_params)
+    index, sample_params = _get_sample_params(bcm, samples, branch_runner.dyn_params)
+    end_idx = len(branch_runner.times) - 1
+
+    def get_end_idx(branches):
+        if not branches:
+            return end_idx
+        return max(branch_runner.get_time_idx(b.branch_time) for b in branches)
+
+    def run_branches(branches, parent_segments, parent_trajectories, path):
+        results = {}
+        for branch in branches:
+            branch_idx = branch_runner.get_time_idx(branch.branch_time)
+            branch_end_idx = get_end_idx(branch.children)
+            # Parameters of each sample's segments, up to and from the branch time
+            segments = [
+                [seg for seg in s if seg[0] < branch_idx] + [(branch_idx, s[-1][1] | branch.params)]
+                for s in parent_segments
+            ]
+            trajectories = [
+                branch_runner.run_segment(s[-1][1], t[: branch_idx + 1], branch_end_idx)
+                for s, t in zip(segments, parent_trajectories)
+            ]
+            branch_path = path + (branch.name,)
+            if branch.children:
+                results.update(run_branches(branch.children, segments, trajectories, branch_path))
+            else:
+                values = np.stack(
+                    [branch_runner.calc_outputs(s, t) for s, t in zip(segments, trajectories)]
+                )
+                results[branch_path] = BatchResults(
+                    values, index, get_result_times(bcm), branch_runner.outputs
+                )
+        return results
+
+    trunk_end_idx = get_end_idx(tree)
+    trunk = [branch_runner.run_segment(p, None, trunk_end_idx) for p in sample_params]
+    trunk_segments = [[(0, p)] for p in sample_params]
+    return run_branches(tree, trunk_segments, trunk, ())
@@ -0,0 +1,275 @@
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Dict, List, Union
+import numpy as np
+import arviz as az
+import pymc as pm
+from pymc.backends.base import MultiTrace
+from pymc.backends.ndarray import NDArray
+from pymc.initial_point import make_initial_point_fn
+from estival.wrappers import pymc as epm
+
+from tbdynamics.calibration.parallel import init_worker_xla
+
+# Tuning state of DEMetropolisZ, saved with each checkpoint
+STEP_STATE = ["scaling", "lamb", "steps_until_tune", "accepted", "tune"]
+
+
+def _check_pymc_internals(obj, attrs: List[str]):
+    # Checkpoints save and restore private pymc state (of the pymc version pinned in
+    # pyproject.toml), which may change between pymc versions
+    missing = [attr for attr in attrs if not hasattr(obj, attr)]
+    if missing:
+        raise NotImplementedError(
+            f"Checkpointing relies on {type(obj).__name__} attributes {missing}, which "
+            f"pymc {pm.__version__} does not have"
+        )
+
+
+def _get_checkpoint_file(checkpoint_path: Path, chain: int) -> Path:
+    return Path(checkpoint_path) / f"chain_{chain}.npz"
+
+
+def _save_checkpoint(
+    checkpoint_file: Path, trace: NDArray, step: pm.DEMetropolisZ, point: Dict[str, np.ndarray]
+):
+    n_done = trace.draw_idx
+    arrays = {f"sample/{k}": v[:n_done] for k, v in trace.samples.items()}
+    arrays.update({f"stat/{k}": v[:n_done] for k, v in trace._stats[0].items()})
+    arrays.update({f"point/{k}": v for k, v in point.items()})
+    arrays.update({f"step/{k}": np.asarray(getattr(step, k)) for k in STEP_STATE})
+    arrays["step/history"] = (
+        np.stack(step._history) if step._history else np.empty((0, 0))
+    )
+    _, rng_keys, rng_pos, rng_has_gauss, rng_gauss = np.random.get_state()
+    arrays.update(
+        {"rng/keys": rng_keys, "rng/state": np.array([rng_pos, rng_has_gauss, rng_gauss])}
+    )
+
+    # Write to a temporary file first, so an interruption never leaves a partial checkpoint
+    tmp_file = checkpoint_file.with_name(f".{checkpoint_file.name}.tmp")
+    with open(tmp_file, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def _load_checkpoint(checkpoint_file: Path) -> Dict[str, Dict[str, np.ndarray]]:
+    checkpoint = {}
+    with np.load(checkpoint_file) as arrays:
+        for key in arrays.files:
+            group, name = key.split("/", 1)
+            checkpoint.setdefault(group, {})[name] = arrays[key]
+    return checkpoint
+
+
+def _restore_trace(trace: NDArray, checkpoint: Dict[str, Dict[str, np.ndarray]]) -> int:
+    n_done = len(checkpoint["stat"]["tune"])
+    for k, values in checkpoint["sample"].items():
+        trace.samples[k][:n_done] = values
+    for k, values in checkpoint["stat"].items():
+        trace._stats[0][k][:n_done] = values
+    trace.draw_idx = n_done
+    return n_done
+
+
+def _sample_chain(
+    get_bcm: Callable,
+    bcm_args: tuple,
+    bcm_kwargs: dict,
+    checkpoint_path: Path,
+    chain: int,
+    draws: int,
+    tune: int,
+    initvals: Dict[str, float],
+    random_seed: int,
+    checkpoint_every: int,
+    step_kwargs: dict,
+):
+    bcm = get_bcm(*bcm_args, **bcm_kwargs)
+    n_total = tune + draws
+    checkpoint_file = _get_checkpoint_file(checkpoint_path, chain)
+    with pm.Model() as model:
+        variables = epm.use_model(bcm)
+        step = pm.DEMetropolisZ(variables, **step_kwargs)
+        trace = NDArray(model=model)
+        trace.setup(n_total, chain, step.stats_dtypes)
+        _check_pymc_internals(trace, ["_stats", "draw_idx"])
+        _check_pymc_internals(step, ["_history", *STEP_STATE])
+
+        if checkpoint_file.exists():
+            checkpoint = _load_checkpoint(checkpoint_file)
+            n_done = _restore_trace(trace, checkpoint)
+            point = checkpoint["point"]
+            for k in STEP_STATE:
+                value = checkpoint["step"][k]
+                setattr(step, k, value if value.ndim else value.item())
+            step._history = list(checkpoint["step"]["history"])
+            rng_pos, rng_has_gauss, rng_gauss = checkpoint["rng"]["state"]
+            np.random.set_state(
+                ("MT19937", checkpoint["rng"]["keys"], int(rng_pos), int(rng_has_gauss), rng_gauss)
+            )
+        else:
+            n_done = 0
+            point = make_initial_point_fn(
+                model=model, overrides=initvals, jitter_rvs=set(), return_transformed=True
+            )(random_seed)
+            np.random.seed(random_seed)
+            step.tune = bool(tune)
+            step.reset_tuning()
+
+        # The same sequence of steps as pm.sample, for a single chain
+        for i in range(n_done, n_total):
+            if i == tune:
+                step.stop_tuning()
+            point, stats = step.step(point)
+            trace.record(point, stats)
+            if (i + 1) % checkpoint_every == 0 or i + 1 == n_total:
+                _save_checkpoint(checkpoint_file, trace, step, point)
+
+
+def _check_run_config(checkpoint_path: Path, run_config: dict):
+    config_file = Path(checkpoint_path) / "run.json"
+    if config_file.exists():
+        with open(config_file) as f:
+            saved_config = json.load(f)
+        if saved_config != run_config:
+            raise ValueError(
+                f"Checkpoints in {checkpoint_path} are for a different run: {saved_config}"
+            )
+    else:
+        Path(checkpoint_path).mkdir(parents=True, exist_ok=True)
+        with open(config_file, "w") as f:
+            json.dump(run_config, f, indent=2)
+
+
+def load_checkpoint_idata(
+    get_bcm: Callable,
+    checkpoint_path: Path,
+    bcm_args: tuple = (),
+    bcm_kwargs: dict = None,
+) -> az.InferenceData:
+    """
+    Concatenates the checkpointed chains of a calibration into an InferenceData, in the layout
+    returned by pm.sample with discard_tuned_samples=False (so with the tuning draws in the
+    warmup groups). Chains that have not finished are included up to their last checkpoint,
+    and all chains are truncated to the shortest of them. Chains without a checkpoint yet are
+    left out, with a warning.
+
+    Args:
+        get_bcm: Function building the model, i.e. the get_bcm of a region.
+        checkpoint_path: Directory of the checkpoints.
+        bcm_args: Positional arguments to get_bcm (e.g. params, covid_effects).
+        bcm_kwargs: Keyword arguments to get_bcm.
+
+    Returns:
+        The calibration results.
+    """
+    with open(Path(checkpoint_path) / "run.json") as f:
+        run_config = json.load(f)
+    chains = range(run_config["chains"])
+    missing = [c for c in chains if not _get_checkpoint_file(checkpoint_path, c).exists()]
+    if len(missing) == len(chains):
+        raise FileNotFoundError(f"No chain has been checkpointed yet in {checkpoint_path}")
+    if missing:
+        warnings.warn(f"Chains {missing} have not been checkpointed yet and are left out")
+
+    bcm = get_bcm(*bcm_args, **(bcm_kwargs or {}))
+    with pm.Model() as model:
+        epm.use_model(bcm)
+        traces = []
+        for chain in [c for c in chains if c not in missing]:
+            checkpoint = _load_checkpoint(_get_checkpoint_file(checkpoint_path, chain))
+            trace = NDArray(model=model)
+            stats_dtypes = [{k: v.dtype for k, v in checkpoint["stat"].items()}]
+            trace.setup(len(checkpoint["stat"]["tune"]), chain, stats_dtypes)
+            _check_pymc_internals(trace, ["_stats", "draw_idx"])
+            _restore_trace(trace, checkpoint)
+            traces.append(trace)
+
+        n_done = min(len(trace) for trace in traces)
+        mtrace = MultiTrace(traces)[:n_done]
+        _check_pymc_internals(mtrace.report, ["_n_tune", "_n_draws"])
+        tune_stat = mtrace._straces[0].get_sampler_stats("tune", sampler_idx=0)
+        mtrace.report._n_tune = int(np.sum(tune_stat))
+        mtrace.report._n_draws = n_done - mtrace.report._n_tune
+        return pm.to_inference_data(mtrace, model=model, save_warmup=True)
+
+
+def sample_with_checkpoints(
+    get_bcm: Callable,
+    checkpoint_path: Path,
+    draws: int,
+    tune: int,
+    chains: int,
+    bcm_args: tuple = (),
+    bcm_kwargs: dict = None,
+    initvals: Union[Dict[str, float], List[Dict[str, float]]] = None,
+    random_seed: int = None,
+    checkpoint_every: int = 500,
+    cores: int = None,
+    step_kwargs: dict = None,
+) -> az.InferenceData:
+    """
+    Calibrates the model with DEMetropolisZ (as pm.sample with a DEMetropolisZ step), saving
+    each chain to disk every checkpoint_every iterations: the draws and sampler statistics so
+    far, along with the sampler state (the DE-Z history, tuning state and random number
+    generator state).
+    If checkpoints of the same run are found in checkpoint_path, each chain resumes from its
+    last checkpoint, continuing exactly as the uninterrupted run would have.
+
+    Args:
+        get_bcm: Function building the model, i.e. the get_bcm of a region.
+        checkpoint_path: Directory of the checkpoints, created if it doesn't exist.
+        draws: Number of draws per chain after tuning.
+        tune: Number of tuning iterations per chain.
+        chains: Number of chains.
+        bcm_args: Positional arguments to get_bcm (e.g. params, covid_effects).
+        bcm_kwargs: Keyword arguments to get_bcm.
+        initvals: Starting values of the parameters, for all chains or a list with one per chain.
+        random_seed: Seed for the first chain (incremented for each further chain).
+        checkpoint_every: Number of iterations between checkpoints.
+        cores: Number of chains sampled in parallel processes; the number of cores if None.
+        step_kwargs: Keyword arguments to pm.DEMetropolisZ (e.g. proposal_dist).
+
+    Returns:
+        The calibration results, as from load_checkpoint_idata.
+    """
+    bcm_kwargs = bcm_kwargs or {}
+    _check_run_config(checkpoint_path, {"draws": draws, "tune": tune, "chains": chains})
+    if random_seed is None:
+        random_seed = int(np.random.randint(2**30))
+    if not isinstance(initvals, list):
+        initvals = [initvals] * chains
+    chain_args = [
+        (
+            get_bcm,
+            bcm_args,
+            bcm_kwargs,
+            checkpoint_path,
+            chain,
+            draws,
+            tune,
+            initvals[chain],
+            random_seed + chain,
+            checkpoint_every,
+            step_kwargs or {},
+        )
+        for chain in range(chains)
+    ]
+
+    n_workers = min(cores or os.cpu_count(), chains)
+    if n_workers == 1:
+        for args in chain_args:
+            _sample_chain(*args)
+    else:
+        with ProcessPoolExecutor(
+            n_workers, mp_context=get_context("spawn"), initializer=init_worker_xla
+        ) as executor:
+            for future in [executor.submit(_sample_chain, *args) for args in chain_args]:
+                future.result()
+
+    return load_checkpoint_idata(get_bcm, checkpoint_path, bcm_args, bcm_kwargs)
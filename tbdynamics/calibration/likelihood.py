@@ -0,0 +1,252 @@
+from typing import Callable, Dict, List, Tuple
+from weakref import WeakKeyDictionary
+import numpy as np
+import pandas as pd
+import xarray as xr
+import arviz as az
+import jax
+from jax import scipy as jsp
+from estival.model import BayesianCompartmentalModel
+from estival.priors import BasePrior
+from estival.targets import NormalTargetEvaluator
+
+from tbdynamics.calibration.batch import get_dynamic_params, get_result_times
+
+# Compiled pointwise log-likelihood functions for each model
+_pointwise_ll_cache = WeakKeyDictionary()
+
+
+def get_target_times(targets: List) -> List[float]:
+    """
+    Gets all the times at which any of the targets has data.
+
+    Args:
+        targets: The calibration targets.
+
+    Returns:
+        The sorted target times.
+    """
+    return sorted(set().union(*(target.data.index for target in targets)))
+
+
+def _check_normal_evaluator(evaluator):
+    if not isinstance(evaluator, NormalTargetEvaluator):
+        raise NotImplementedError(
+            f"No pointwise log-likelihood for {type(evaluator).__name__} targets"
+        )
+
+
+def _get_point_weights(evaluator) -> np.ndarray:
+    # Weights scaling the target's pointwise log densities to its contribution to the
+    # log-likelihood (e.g. the mean over its data points)
+    _check_normal_evaluator(evaluator)
+    target = evaluator.target
+    if evaluator.time_weights is not None:
+        return np.asarray(evaluator.time_weights * target.weight, dtype=float)
+    return np.full(len(evaluator.data), target.weight / len(evaluator.data))
+
+
+def _get_pointwise_evaluator(evaluator) -> Callable:
+    # Per-point version of the target's evaluator, returning the unweighted log density of
+    # each data point
+    _check_normal_evaluator(evaluator)
+    target = evaluator.target
+
+    def evaluate(modelled, parameters):
+        sd = parameters[target.stdev.name] if isinstance(target.stdev, BasePrior) else target.stdev
+        return jsp.stats.norm.logpdf(evaluator.data, loc=modelled[evaluator.index], scale=sd)
+
+    return evaluate
+
+
+def get_pointwise_ll_func(bcm: BayesianCompartmentalModel) -> Callable:
+    """
+    Builds a compiled function returning the log density of each target data point for
+    a batch of parameter sets under jax.vmap, running only the outputs the targets need
+    (as for bcm.loglikelihood).
+
+    Args:
+        bcm: The Bayesian compartmental model.
+
+    Returns:
+        Function mapping the parameters (an array of values over the batch for every prior)
+        to arrays of the pointwise log densities by target, each (batch, target time).
+    """
+    if bcm in _pointwise_ll_cache:
+        return _pointwise_ll_cache[bcm]
+
+    result_times = get_result_times(bcm)
+    evaluators = {
+        name: (
+            target.model_key,
+            _get_pointwise_evaluator(target.get_evaluator(result_times, bcm.epoch)),
+        )
+        for name, target in bcm.targets.items()
+    }
+    dyn_params = get_dynamic_params(bcm)
+    runner = bcm.model.get_runner(
+        bcm.parameters,
+        dyn_params,
+        jit=False,
+        include_full_outputs=False,
+        derived_outputs=sorted({target.model_key for target in bcm.targets.values()}),
+    )
+    run_func = runner.function
+
+    def pointwise_ll(parameters):
+        derived_outputs = run_func({p: parameters[p] for p in dyn_params})["derived_outputs"]
+        return {
+            name: evaluate(derived_outputs[model_key], parameters)
+            for name, (model_key, evaluate) in evaluators.items()
+        }
+
+    _pointwise_ll_cache[bcm] = jax.jit(jax.vmap(pointwise_ll))
+    return _pointwise_ll_cache[bcm]
+
+
+def get_observation_index(bcm: BayesianCompartmentalModel) -> pd.MultiIndex:
+    """
+    Gets the target and time of each observation, in the order of the observations of
+    get_loglikelihood_idata.
+
+    Args:
+        bcm: The Bayesian compartmental model.
+
+    Returns:
+        Index with levels target and time.
+    """
+    result_times = get_result_times(bcm)
+    observations = []
+    for name, target in bcm.targets.items():
+        evaluator = target.get_evaluator(result_times, bcm.epoch)
+        observations += [(name, time) for time in result_times[evaluator.index]]
+    return pd.MultiIndex.from_tuples(observations, names=["target", "time"])
+
+
+def get_observation_weights(bcm: BayesianCompartmentalModel) -> Dict[str, np.ndarray]:
+    """
+    Gets the weights of each target's data points in bcm.loglikelihood, i.e. the factors
+    scaling the pointwise log densities of get_pointwise_ll_func so that their sum is the
+    model's log-likelihood.
+
+    Args:
+        bcm: The Bayesian compartmental model.
+
+    Returns:
+        The weights of the data points by target, in the order of the target times.
+    """
+    result_times = get_result_times(bcm)
+    return {
+        name: _get_point_weights(target.get_evaluator(result_times, bcm.epoch))
+        for name, target in bcm.targets.items()
+    }
+
+
+def calculate_pointwise_loglikelihood(
+    bcm: BayesianCompartmentalModel, samples, chunk_size: int = 100
+) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+    """
+    Evaluates only the likelihood of the samples (e.g. posterior draws for WAIC or LOO), without
+    calculating or storing any other model outputs, in vectorised chunks of samples.
+    The last chunk is padded to chunk_size, so the function is only compiled once.
+    The pointwise values are the unweighted log densities of the individual observations,
+    as az.loo and az.waic expect, while the log-likelihoods of the samples weight them as in
+    the targets (see get_observation_weights), so that they match bcm.loglikelihood.
+
+    Args:
+        bcm: The Bayesian compartmental model, ideally built with likelihood_only=True.
+        samples: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        chunk_size: Number of samples evaluated in each vectorised call.
+
+    Returns:
+        The pointwise log densities by target, each an array of (sample, target time), and
+        the log-likelihood, log-prior and log-posterior of each sample, in the layout of the
+        extras of esamp.model_results_for_samples.
+    """
+    pointwise_ll = get_pointwise_ll_func(bcm)
+    samples = bcm.sample.convert(samples)
+    param_arrays = {k: np.asarray(samples.components[k], dtype=float) for k in bcm.priors}
+
+    n_samples = len(samples.index)
+    sample_ll = {name: [] for name in bcm.targets}
+    for start in range(0, n_samples, chunk_size):
+        chunk = {k: values[start : start + chunk_size] for k, values in param_arrays.items()}
+        n_chunk = min(chunk_size, n_samples - start)
+        if n_chunk < chunk_size:
+            chunk = {
+                k: np.concatenate([values, np.repeat(values[-1:], chunk_size - n_chunk)])
+                for k, values in chunk.items()
+            }
+        for name, values in pointwise_ll(chunk).items():
+            sample_ll[name].append(np.asarray(values)[:n_chunk])
+
+    pointwise = {name: np.concatenate(values) for name, values in sample_ll.items()}
+    weights = get_observation_weights(bcm)
+    target_ll = {f"ll_{name}": values @ weights[name] for name, values in pointwise.items()}
+    loglikelihood = np.sum(list(target_ll.values()), axis=0)
+    logprior = np.sum(
+        [prior.logpdf(param_arrays[k]) for k, prior in bcm.priors.items()], axis=0
+    )
+    extras = pd.DataFrame(
+        {
+            "logposterior": logprior + loglikelihood,
+            "logprior": logprior,
+            "loglikelihood": loglikelihood,
+            **target_ll,
+        },
+        index=samples.index,
+    )
+    return pointwise, extras
+
+
+def get_loglikelihood_idata(
+    bcm: BayesianCompartmentalModel, pointwise_ll: Dict[str, np.ndarray], ll_res: pd.DataFrame
+) -> az.InferenceData:
+    """
+    Stores the pointwise log densities of the samples in the log_likelihood group of an
+    InferenceData, as a single (chain, draw, observation) variable with one observation per
+    target time, so that az.loo and az.waic work on the individual observations.
+    The log densities are unweighted, so the log_likelihood group doesn't sum to the
+    target-weighted log-likelihood of the samples, which is in ll_res.
+    Samples indexed by every draw of every chain (e.g. a full posterior) keep their chains;
+    otherwise (e.g. an extracted posterior, whose chains can have different numbers of draws)
+    they are stored as draws of a single chain.
+
+    Args:
+        bcm: The Bayesian compartmental model the log-likelihoods were calculated with.
+        pointwise_ll: Pointwise log densities from calculate_pointwise_loglikelihood.
+        ll_res: Log-likelihoods of the samples from calculate_pointwise_loglikelihood.
+
+    Returns:
+        InferenceData with the log-posterior, log-prior and pointwise log-likelihood.
+    """
+    sample_index = ll_res.index
+    n_chains = 1
+    if sample_index.names == ["chain", "draw"]:
+        # Only keep the chains if the samples form a complete (chain, draw) grid in that order
+        chains, draws = sample_index.unique("chain"), sample_index.unique("draw")
+        grid = pd.MultiIndex.from_product([chains.sort_values(), draws.sort_values()])
+        if sample_index.equals(grid):
+            n_chains = len(chains)
+    shape = (n_chains, len(sample_index) // n_chains)
+
+    observations = get_observation_index(bcm)
+    ll_values = np.concatenate([pointwise_ll[name] for name in bcm.targets], axis=1)
+    coords = {
+        "observation": np.arange(len(observations)),
+        "target": ("observation", observations.get_level_values("target")),
+        "time": ("observation", observations.get_level_values("time")),
+    }
+    log_likelihood = xr.Dataset(
+        {"loglikelihood": (["chain", "draw", "observation"], ll_values.reshape(*shape, -1))},
+        coords=coords,
+    )
+    return az.InferenceData(
+        posterior=xr.Dataset(
+            {"logposterior": (["chain", "draw"], ll_res["logposterior"].values.reshape(shape))}
+        ),
+        prior=xr.Dataset(
+            {"logprior": (["chain", "draw"], ll_res["logprior"].values.reshape(shape))}
+        ),
+        log_likelihood=log_likelihood,
+    )
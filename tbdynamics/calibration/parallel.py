@@ -0,0 +1,117 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+
+from tbdynamics.calibration.batch import (
+    BatchResults,
+    get_batch_runner,
+    get_result_times,
+    get_runtime_params,
+)
+
+# Restrict each worker's XLA to one thread, so that workers don't compete for the cores
+WORKER_XLA_FLAGS = "--xla_cpu_multi_thread_eigen=false"
+
+# The model of each worker process, built once by the pool initializer
+_worker_bcm = None
+
+
+def init_worker_xla():
+    """
+    Adds WORKER_XLA_FLAGS to the XLA flags of a spawned worker process, for use in the
+    initializer of a process pool, so that the parent's environment is left unchanged.
+    XLA reads its flags when jax first runs a computation, which the workers only do after
+    the initializer.
+    """
+    xla_flags = os.environ.get("XLA_FLAGS")
+    os.environ["XLA_FLAGS"] = f"{xla_flags} {WORKER_XLA_FLAGS}" if xla_flags else WORKER_XLA_FLAGS
+
+
+def _init_worker(get_bcm: Callable, bcm_args: tuple, bcm_kwargs: dict):
+    global _worker_bcm
+    init_worker_xla()
+    _worker_bcm = get_bcm(*bcm_args, **bcm_kwargs)
+
+
+def _run_shard(
+    shard_params: List[Dict[str, float]], outputs: List[str]
+) -> Tuple[np.ndarray, List[str]]:
+    values = []
+    for params in shard_params:
+        derived_outputs = _worker_bcm.run(params, include_extras=False).derived_outputs
+        outputs = outputs or sorted(derived_outputs.columns)
+        values.append(derived_outputs[outputs].to_numpy())
+    return np.stack(values), outputs
+
+
+def run_samples_parallel(
+    get_bcm: Callable,
+    samples,
+    bcm_args: tuple = (),
+    bcm_kwargs: dict = None,
+    outputs: List[str] = None,
+    n_workers: int = None,
+    shards_per_worker: int = 4,
+) -> BatchResults:
+    """
+    Runs the model for all the samples (e.g. an extracted posterior) across a pool of worker
+    processes. Each worker builds the model once and keeps it compiled for all the shards of
+    samples it runs, and the shards are written into one preallocated array in sample order.
+    Workers are started with spawn and single-threaded XLA, so that run time scales with the
+    number of workers up to the number of cores.
+    The workers run the samples with estival's runner, so only the parameters with priors can
+    vary between them (see get_runtime_params).
+
+    Args:
+        get_bcm: Function building the model, i.e. the get_bcm of a region.
+        samples: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        bcm_args: Positional arguments to get_bcm (e.g. params, covid_effects).
+        bcm_kwargs: Keyword arguments to get_bcm.
+        outputs: Derived outputs to return; all saved outputs if None.
+        n_workers: Number of worker processes; the number of cores if None.
+        shards_per_worker: Number of shards per worker, for balancing the load between them.
+
+    Returns:
+        The results for every sample, in the order of the input samples.
+    """
+    bcm_kwargs = bcm_kwargs or {}
+    # The model is only built (not compiled) here, for converting the samples
+    bcm = get_bcm(*bcm_args, **bcm_kwargs)
+    samples = bcm.sample.convert(samples)
+    runtime_params = get_runtime_params(bcm, samples)
+    if runtime_params:
+        raise ValueError(
+            f"Parameters without priors {runtime_params} can't vary in estival's runner; "
+            "use run_samples_batched"
+        )
+    sample_params = [params for _, params in samples.iterrows()]
+    n_samples = len(sample_params)
+    times = get_result_times(bcm)
+    if n_samples == 0:
+        outputs = outputs or get_batch_runner(bcm)[2]
+        return BatchResults(np.empty((0, len(times), len(outputs))), samples.index, times, outputs)
+    n_workers = n_workers or os.cpu_count()
+    n_shards = min(n_samples, n_workers * shards_per_worker)
+    bounds = np.linspace(0, n_samples, n_shards + 1).astype(int)
+
+    values = None
+    with ProcessPoolExecutor(
+        n_workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(get_bcm, bcm_args, bcm_kwargs),
+    ) as executor:
+        futures = {
+            executor.submit(_run_shard, sample_params[start:end], outputs): start
+            for start, end in zip(bounds[:-1], bounds[1:])
+        }
+        for future in as_completed(futures):
+            shard_values, outputs = future.result()
+            if values is None:
+                values = np.empty((n_samples, *shard_values.shape[1:]))
+            start = futures[future]
+            values[start : start + len(shard_values)] = shard_values
+
+    return BatchResults(values, samples.index, times, outputs)
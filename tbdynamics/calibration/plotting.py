@@ -4,7 +4,8 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.express as px
 import plotly.io as pio
-from typing import List, Dict
+from pathlib import Path
+from typing import List, Dict, Union
 
 from tbdynamics.constants import (
     indicator_names,
@@ -468,7 +469,7 @@ def plot_output_ranges(
 
 
 def plot_outputs_for_covid(
-    covid_outputs: Dict[str, Dict[str, pd.DataFrame]],
+    covid_outputs: Union[Dict[str, Dict[str, pd.DataFrame]], Path],
     target_data: Dict[str, pd.Series],
     plot_start_date: int = 2011,
     plot_end_date: int = 2024,
@@ -479,7 +480,8 @@ def plot_outputs_for_covid(
     based on configuration keys, include target points, and show LOO-IC in the bottom left.
 
     Args:
-        covid_outputs: Dictionary containing outputs for each scenario.
+        covid_outputs: Dictionary containing outputs for each scenario, or the path to a results
+            store holding the scenarios (from which only the notifications are read).
         target_data: Calibration targets.
         plot_start_date: Start year for the plot.
         plot_end_date: End year for the plot.
@@ -522,7 +524,15 @@ def plot_outputs_for_covid(
     for i, (scenario_name, title) in enumerate(covid_titles.items()):
         row = i // n_cols + 1
         col = i % n_cols + 1
-        quantile_outputs = covid_outputs[scenario_name]["indicator_outputs"]
+        if isinstance(covid_outputs, (str, Path)):
+            # Only needs h5py and h5netcdf for results stores
+            from tbdynamics.calibration.results_store import load_quantile_outputs
+
+            quantile_outputs = load_quantile_outputs(
+                covid_outputs, scenario_name, ["notification"], (plot_start_date, plot_end_date)
+            )
+        else:
+            quantile_outputs = covid_outputs[scenario_name]["indicator_outputs"]
         data = quantile_outputs["notification"]
 
         # Filter data by date range
@@ -747,28 +757,49 @@ def hex_to_rgb(hex_color):
 
 
 def plot_scenario_output_ranges_by_col(
-    scenario_outputs: Dict[str, Dict[str, pd.DataFrame]],
+    scenario_outputs: Union[Dict[str, Dict[str, pd.DataFrame]], Path],
     plot_start_date: float = 2025.0,
     plot_end_date: float = 2036.0,
     max_alpha: float = 0.7,
     plot_extreme: bool = False,  # New argument to control whether to plot the base scenario
+    store_base_scenario: str = "detection",
 ) -> go.Figure:
     """
     Plot the credible intervals for incidence and mortality_raw with scenarios as rows.
     Also plot 2030 SDG targets in purple and 2035 End TB targets in red.
 
     Args:
-        scenario_outputs: Dictionary containing scenario outputs, with scenario names as keys.
+        scenario_outputs: Dictionary containing scenario outputs, with scenario names as keys, or
+            the path to a results store holding the scenarios (from which only the plotted
+            indicators and years are read).
         plot_start_date: Start year for the plot as float.
         plot_end_date: End year for the plot as float.
         max_alpha: Maximum alpha value to use in patches.
         plot_base_scenario: Boolean flag to indicate whether to plot the base scenario.
+        store_base_scenario: For a results store, the scenario which the improved detection
+            scenarios are built on, plotted as the base scenario.
 
     Returns:
         The interactive Plotly figure.
     """
     indicators = ["incidence", "mortality_raw"]
-    scenario_keys = list(scenario_outputs.keys())
+    from_store = isinstance(scenario_outputs, (str, Path))
+    if from_store:
+        # Only needs h5py and h5netcdf for results stores
+        from tbdynamics.calibration.results_store import list_scenarios, load_quantile_outputs
+
+        # Map the scenario names of the store (from run_scenario_matrix) to the plot keys,
+        # leaving out scenarios that aren't the base or its improved detection scenarios
+        detection_prefix = f"{store_base_scenario}_"
+        store_scenarios = {}
+        for store_key in list_scenarios(scenario_outputs):
+            if store_key == store_base_scenario:
+                store_scenarios["base_scenario"] = store_key
+            elif store_key.startswith(f"{detection_prefix}increase_case_detection_by_"):
+                store_scenarios[store_key[len(detection_prefix) :]] = store_key
+        scenario_keys = list(store_scenarios)
+    else:
+        scenario_keys = list(scenario_outputs.keys())
 
     # Exclude the base scenario if plot_base_scenario is False
     if plot_extreme:
@@ -793,8 +824,8 @@ def plot_scenario_output_ranges_by_col(
         ind: colors[i % len(colors)] for i, ind in enumerate(indicators)
     }
 
-    # Define the scenario titles manually
-    y_axis_titles = ["Status-quo scenario", "Scenario 1", "Scenario 2", "Scenario 3"]
+    # Define the scenario titles, falling back to the scenario key for any other scenarios
+    y_axis_titles = {**scenario_names, "base_scenario": "Status-quo scenario"}
 
     # Create the subplots without shared y-axis
     fig = make_subplots(
@@ -818,18 +849,25 @@ def plot_scenario_output_ranges_by_col(
     show_legend_for_target = True  # To ensure the legend is shown only once
 
     for scenario_idx, scenario_key in enumerate(scenario_keys):
-        quantile_outputs = scenario_outputs[scenario_key]
         row = scenario_idx + 1
 
-        # Get the formatted scenario name from the manual list
-        display_name = y_axis_titles[scenario_idx]
-
-        quantile_data = (
-            quantile_outputs["quantiles"]
-            if scenario_key == "base_scenario"
-            else quantile_outputs
+        # Get the formatted scenario name
+        display_name = y_axis_titles.get(
+            scenario_key, scenario_key.replace("_", " ").capitalize()
         )
 
+        if from_store:
+            quantile_data = load_quantile_outputs(
+                scenario_outputs,
+                store_scenarios[scenario_key],
+                indicators,
+                (plot_start_date, plot_end_date),
+            )
+        elif scenario_key == "base_scenario":
+            quantile_data = scenario_outputs[scenario_key]["quantiles"]
+        else:
+            quantile_data = scenario_outputs[scenario_key]
+
         for j, indicator_name in enumerate(indicators):
             col = j + 1
             color = indicator_colors[indicator_name]
@@ -0,0 +1,151 @@
+from pathlib import Path
+from typing import Dict, List, Tuple
+import h5py
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from tbdynamics.constants import quantiles
+
+# Each scenario is stored as its own group, so that scenarios can be appended to a store
+# without rewriting the data already in it
+SCENARIO_GROUP = "scenarios"
+
+# Attribute of the store listing its scenarios in the order they were written, as HDF5 lists
+# groups by name
+SCENARIO_ORDER_ATTR = "scenario_order"
+
+
+def list_scenarios(store_path: Path) -> List[str]:
+    """
+    Gets the scenarios held in a results store, in the order they were written.
+
+    Args:
+        store_path: Path to the store (a NetCDF4/HDF5 file).
+
+    Returns:
+        The scenario names.
+    """
+    if not Path(store_path).exists():
+        return []
+    with h5py.File(store_path, "r") as store:
+        return [str(name) for name in store.attrs.get(SCENARIO_ORDER_ATTR, [])]
+
+
+def write_scenario_results(
+    scenario_results: xr.DataArray, store_path: Path, complevel: int = 4
+):
+    """
+    Writes scenario outputs (e.g. from run_scenario_matrix) to a results store, appending
+    them to any scenarios already held there.
+    Each indicator is written as its own compressed chunk, so that reading one indicator
+    does not decompress the others.
+
+    Args:
+        scenario_results: Array with dims (scenario, sample, time, indicator).
+        store_path: Path to the store (a NetCDF4/HDF5 file), created if it doesn't exist.
+        complevel: zlib compression level.
+    """
+    existing = set(list_scenarios(store_path)).intersection(scenario_results["scenario"].values)
+    if existing:
+        raise ValueError(f"Scenarios already in the results store: {sorted(existing)}")
+
+    for scenario in scenario_results["scenario"].values:
+        results = scenario_results.sel(scenario=scenario, drop=True)
+        sample_index = results.indexes["sample"]
+        sample_levels = ""
+        if isinstance(sample_index, pd.MultiIndex):
+            # NetCDF can't hold a MultiIndex, so store its levels as coordinates of the samples
+            sample_levels = " ".join(sample_index.names)
+            results = results.drop_vars(["sample", *sample_index.names]).assign_coords(
+                {name: ("sample", sample_index.get_level_values(name)) for name in sample_index.names}
+            )
+        results = results.rename("outputs").assign_attrs(sample_levels=sample_levels)
+        n_samples, n_times, _ = results.shape
+        results.to_netcdf(
+            store_path,
+            mode="a" if Path(store_path).exists() else "w",
+            group=f"{SCENARIO_GROUP}/{scenario}",
+            engine="h5netcdf",
+            encoding={
+                "outputs": {
+                    "zlib": True,
+                    "complevel": complevel,
+                    "chunksizes": (n_samples, n_times, 1),
+                }
+            },
+        )
+        with h5py.File(store_path, "a") as store:
+            scenario_order = [*store.attrs.get(SCENARIO_ORDER_ATTR, []), str(scenario)]
+            store.attrs[SCENARIO_ORDER_ATTR] = np.array(scenario_order, dtype=h5py.string_dtype())
+
+
+def load_scenario_results(
+    store_path: Path,
+    scenarios: List[str] = None,
+    indicators: List[str] = None,
+    time_range: Tuple[float, float] = None,
+) -> xr.DataArray:
+    """
+    Reads a slice of the scenario outputs of a results store, reading only the data of the
+    requested scenarios and indicators from disk.
+
+    Args:
+        store_path: Path to the store (a NetCDF4/HDF5 file).
+        scenarios: Scenarios to read; all the scenarios in the store if None.
+        indicators: Indicators to read; all those stored if None.
+        time_range: Start and end times (inclusive) to read; all times if None.
+
+    Returns:
+        Array with dims (scenario, sample, time, indicator).
+    """
+    scenarios = scenarios or list_scenarios(store_path)
+    scenario_results = []
+    for scenario in scenarios:
+        with xr.open_dataarray(
+            store_path, group=f"{SCENARIO_GROUP}/{scenario}", engine="h5netcdf"
+        ) as results:
+            if indicators is not None:
+                results = results.sel(indicator=indicators)
+            if time_range is not None:
+                results = results.sel(time=slice(*time_range))
+            results = results.load()
+        sample_levels = results.attrs.pop("sample_levels")
+        if sample_levels:
+            results = results.set_index(sample=sample_levels.split())
+        scenario_results.append(results)
+
+    return xr.concat(scenario_results, dim=pd.Index(scenarios, name="scenario")).rename(None)
+
+
+def load_quantile_outputs(
+    store_path: Path,
+    scenario: str,
+    indicators: List[str],
+    time_range: Tuple[float, float] = None,
+    output_quantiles: List[float] = quantiles,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Calculates the quantiles over the samples of indicators of one scenario of a results store,
+    in the layout of esamp.quantiles_for_results used by the plotting functions.
+
+    Args:
+        store_path: Path to the store (a NetCDF4/HDF5 file).
+        scenario: The scenario.
+        indicators: The indicators.
+        time_range: Start and end times (inclusive) to read; all times if None.
+        output_quantiles: The quantiles to calculate.
+
+    Returns:
+        DataFrames of the quantiles (times as index and quantiles as columns), by indicator.
+    """
+    results = load_scenario_results(store_path, [scenario], indicators, time_range)
+    results = results.sel(scenario=scenario).quantile(output_quantiles, dim="sample")
+    return {
+        ind: pd.DataFrame(
+            results.sel(indicator=ind).transpose("time", "quantile").values,
+            index=results.indexes["time"],
+            columns=output_quantiles,
+        )
+        for ind in indicators
+    }
@@ -0,0 +1,173 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from tbdynamics.calibration.batch import get_result_times, get_runtime_params, run_samples_batched
+from tbdynamics.calibration.summary import calculate_diff_quantiles, get_diff_quantile_tables
+from tbdynamics.calibration.utils import set_sample_params
+from tbdynamics.constants import quantiles
+
+# Cumulative indicators and the derived outputs they accumulate
+cumulative_indicators = {
+    "cumulative_diseased": "incidence_raw",
+    "cumulative_deaths": "mortality_raw",
+}
+
+
+@dataclass
+class ScenarioSpec:
+    name: str
+    bcm_kwargs: Dict[str, Any] = field(default_factory=dict)  # passed on to get_bcm
+    params: Dict[str, float] = field(default_factory=dict)  # set for every sample
+
+
+def get_detection_scenario_name(multiplier: float, covid_config_name: str = "detection") -> str:
+    """
+    Gets the name of an improved detection scenario in a scenario matrix.
+
+    Args:
+        multiplier: The improved detection multiplier.
+        covid_config_name: Name of the COVID configuration the scenario is built on.
+
+    Returns:
+        The scenario name.
+    """
+    return f"{covid_config_name}_increase_case_detection_by_{multiplier}".replace(".", "_")
+
+
+def run_scenario_matrix(
+    get_bcm: Callable,
+    params: Dict[str, float],
+    idata_extract,
+    scenarios: List[ScenarioSpec],
+    indicators: List[str],
+    chunk_size: int = None,
+) -> xr.DataArray:
+    """
+    Runs every scenario once for every posterior sample, collecting the requested indicators
+    into one labelled array, so that the differences and summaries between scenarios can all
+    be calculated from the same runs.
+
+    Args:
+        get_bcm: Function building the model, i.e. the get_bcm of a region.
+        params: Fixed parameters passed to get_bcm.
+        idata_extract: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        scenarios: The scenarios to run.
+        indicators: Derived outputs to collect.
+        chunk_size: Number of samples per vectorised call, to run the samples with the batch
+            runner (with the model's own solver, see get_batch_runner); the samples are run
+            one at a time if None, except for scenarios setting parameters without priors
+            (see get_runtime_params), which are always run with the batch runner.
+
+    Returns:
+        Array with dims (scenario, sample, time, indicator).
+    """
+    values, times, sample_index = None, None, None
+    for i, spec in enumerate(scenarios):
+        bcm = get_bcm(params, **spec.bcm_kwargs)
+        samples = bcm.sample.convert(idata_extract)
+        if spec.params:
+            samples = set_sample_params(samples, spec.params)
+        if chunk_size or get_runtime_params(bcm, samples):
+            batch_kwargs = {"chunk_size": chunk_size} if chunk_size else {}
+            scenario_values = run_samples_batched(
+                bcm, samples, outputs=indicators, **batch_kwargs
+            ).values
+        else:
+            scenario_values = np.stack(
+                [
+                    bcm.run(sample_params, include_extras=False).derived_outputs[indicators]
+                    for _, sample_params in samples.iterrows()
+                ]
+            )
+        if values is None:
+            times, sample_index = get_result_times(bcm), samples.index
+            values = np.empty((len(scenarios), *scenario_values.shape))
+        elif not get_result_times(bcm).equals(times):
+            raise ValueError(f"Output times of scenario {spec.name} differ from the others")
+        values[i] = scenario_values
+
+    return xr.DataArray(
+        values,
+        coords={
+            "scenario": [spec.name for spec in scenarios],
+            "sample": sample_index,
+            "time": np.asarray(times),
+            "indicator": list(indicators),
+        },
+        dims=["scenario", "sample", "time", "indicator"],
+    )
+
+
+def get_cumulative_yearly(
+    scenario_results: xr.DataArray,
+    cumulative_start_time: float = 2020.0,
+    indicators: Dict[str, str] = cumulative_indicators,
+) -> xr.DataArray:
+    """
+    Accumulates yearly values of indicators from a start year.
+
+    Args:
+        scenario_results: Array from run_scenario_matrix.
+        cumulative_start_time: Year to start calculating the cumulative values.
+        indicators: Names of the cumulative indicators and the indicators they accumulate.
+
+    Returns:
+        Array of the cumulative indicators, at the integer years from the start year.
+    """
+    times = scenario_results["time"]
+    yearly = scenario_results.sel(
+        time=(times >= cumulative_start_time) & (times % 1 == 0),
+        indicator=list(indicators.values()),
+    )
+    return yearly.cumsum("time").assign_coords(indicator=list(indicators))
+
+
+def get_scenario_diffs(
+    scenario_results: xr.DataArray, scenario: str, baseline: str
+) -> Dict[str, xr.DataArray]:
+    """
+    Calculates the absolute and relative differences of a scenario from a baseline scenario,
+    for each sample.
+
+    Args:
+        scenario_results: Array from run_scenario_matrix (or a reduction of it).
+        scenario: The scenario to compare.
+        baseline: The baseline scenario.
+
+    Returns:
+        The absolute ("abs") and relative ("rel") differences.
+    """
+    baseline_results = scenario_results.sel(scenario=baseline, drop=True)
+    abs_diff = scenario_results.sel(scenario=scenario, drop=True) - baseline_results
+    return {"abs": abs_diff, "rel": abs_diff / baseline_results}
+
+
+def get_diff_quantiles(
+    scenario_results: xr.DataArray,
+    scenario: str,
+    baseline: str,
+    years: List[float],
+    diff_quantiles: List[float] = quantiles,
+) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """
+    Calculates the quantiles over the samples of the absolute and relative differences of
+    a scenario from a baseline scenario.
+
+    Args:
+        scenario_results: Array from run_scenario_matrix (or a reduction of it).
+        scenario: The scenario to compare.
+        baseline: The baseline scenario.
+        years: Years for which to calculate the quantiles.
+        diff_quantiles: The quantiles to calculate.
+
+    Returns:
+        DataFrames of the quantiles (years as index and quantiles as columns), by type of
+        difference ("abs" or "rel") and indicator.
+    """
+    diff_values = calculate_diff_quantiles(
+        scenario_results, baseline, years, [scenario], diff_quantiles
+    )
+    return get_diff_quantile_tables(diff_values)[scenario]
@@ -0,0 +1,219 @@
+from typing import List
+import numpy as np
+import pandas as pd
+from estival.model import BayesianCompartmentalModel
+
+from tbdynamics.calibration.batch import (
+    get_batch_runner,
+    get_result_times,
+    get_runtime_params,
+    iter_samples_batched,
+)
+from tbdynamics.constants import quantiles
+
+
+class StreamingQuantiles:
+    """
+    Mergeable quantile sketch of sample results, for every time and output at once, which is
+    updated with chunks of samples as they are produced.
+    Up to max_exact samples are held exactly, giving the same quantiles as
+    esamp.quantiles_for_results. Beyond that, the samples are compressed into a merging
+    t-digest of at most `compression` centroids for each time and output (finest in the tails),
+    so that memory does not grow with the number of samples.
+    """
+
+    def __init__(
+        self, n_times: int, n_outputs: int, compression: int = 200, max_exact: int = 1000
+    ):
+        self.shape = (n_times, n_outputs)
+        self.compression = compression
+        self.max_exact = max_exact
+        self.block_elements = 2**20  # points compressed at a time
+        self.n_samples = 0
+        # Samples (or centroids) along the last axis, for each time and output on the first
+        self.means = np.empty((n_times * n_outputs, 0))
+        self.weights = None  # None while the samples are held exactly
+        self.min = np.full(n_times * n_outputs, np.inf)
+        self.max = np.full(n_times * n_outputs, -np.inf)
+
+    @property
+    def is_exact(self) -> bool:
+        """Whether the samples are still held exactly."""
+        return self.weights is None
+
+    def update(self, values: np.ndarray):
+        """
+        Adds a chunk of samples to the sketch.
+
+        Args:
+            values: Results with dims (sample, time, output).
+        """
+        n_chunk = len(values)
+        values = np.asarray(values, dtype=float).reshape(n_chunk, -1).T
+        self.min = np.minimum(self.min, values.min(axis=1))
+        self.max = np.maximum(self.max, values.max(axis=1))
+        self.n_samples += n_chunk
+        self._add(values, None if self.is_exact else np.ones_like(values))
+
+    def merge(self, other: "StreamingQuantiles"):
+        """
+        Adds the samples of another sketch of the same times and outputs (e.g. from another
+        process) to this one.
+
+        Args:
+            other: The other sketch.
+        """
+        if other.shape != self.shape:
+            raise ValueError(f"Cannot merge sketches of shapes {self.shape} and {other.shape}")
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.n_samples += other.n_samples
+        if self.is_exact and other.is_exact:
+            self._add(other.means, None)
+        else:
+            self._add(other.means, other._get_weights())
+
+    def _get_weights(self) -> np.ndarray:
+        return np.ones_like(self.means) if self.is_exact else self.weights
+
+    def _add(self, means: np.ndarray, weights: np.ndarray):
+        if weights is None and self.means.shape[1] + means.shape[1] <= self.max_exact:
+            self.means = np.concatenate([self.means, means], axis=1)
+            return
+        if weights is None:
+            weights = np.ones_like(means)
+        self.means, self.weights = self._compress(
+            np.concatenate([self.means, means], axis=1),
+            np.concatenate([self._get_weights(), weights], axis=1),
+        )
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        # Compress blocks of times and outputs at a time, to bound the size of the temporaries
+        block_size = max(1, self.block_elements // means.shape[1])
+        compressed = [
+            self._compress_block(
+                means[start : start + block_size], weights[start : start + block_size]
+            )
+            for start in range(0, len(means), block_size)
+        ]
+        return (
+            np.concatenate([block_means for block_means, _ in compressed]),
+            np.concatenate([block_weights for _, block_weights in compressed]),
+        )
+
+    def _compress_block(self, means: np.ndarray, weights: np.ndarray):
+        n_cells = len(means)
+        order = np.argsort(means, axis=1)
+        means = np.take_along_axis(means, order, axis=1)
+        weights = np.take_along_axis(weights, order, axis=1)
+
+        # Group neighbouring points into centroids of equal width in the t-digest k1 scale,
+        # so that centroids are smallest near the extreme quantiles
+        cum_weights = np.cumsum(weights, axis=1)
+        mid_q = (cum_weights - weights / 2.0) / cum_weights[:, -1:]
+        k = np.arcsin(np.clip(2.0 * mid_q - 1.0, -1.0, 1.0)) / np.pi + 0.5
+        centroid = np.minimum((k * self.compression).astype(int), self.compression - 1)
+
+        flat_idx = (np.arange(n_cells)[:, None] * self.compression + centroid).ravel()
+        size = n_cells * self.compression
+        new_weights = np.bincount(flat_idx, weights.ravel(), size)
+        weighted_sums = np.bincount(
+            flat_idx, (np.where(weights > 0.0, means, 0.0) * weights).ravel(), size
+        )
+        filled = new_weights > 0.0
+        new_means = np.full(size, np.inf)
+        new_means[filled] = weighted_sums[filled] / new_weights[filled]
+        return (
+            new_means.reshape(n_cells, self.compression),
+            new_weights.reshape(n_cells, self.compression),
+        )
+
+    def get_quantiles(self, output_quantiles: List[float] = quantiles) -> np.ndarray:
+        """
+        Estimates quantiles of the samples added so far, interpolating linearly between
+        ranked samples as np.quantile does (exactly, while the samples are held exactly).
+
+        Args:
+            output_quantiles: The quantiles to calculate.
+
+        Returns:
+            Array with dims (quantile, time, output).
+        """
+        if self.is_exact:
+            return np.quantile(self.means, output_quantiles, axis=1).reshape(
+                len(output_quantiles), *self.shape
+            )
+
+        # Rank of the middle of each centroid, between the extreme samples
+        n_cells = len(self.means)
+        ranks = np.cumsum(self.weights, axis=1) - (self.weights + 1.0) / 2.0
+        empty = self.weights == 0.0
+        means = np.where(empty, self.max[:, None], self.means)
+        ranks = np.where(empty, self.n_samples - 1.0, ranks)
+        order = np.argsort(ranks, axis=1, kind="stable")
+        means = np.take_along_axis(means, order, axis=1)
+        ranks = np.take_along_axis(ranks, order, axis=1)
+        means = np.column_stack([self.min, means, self.max])
+        ranks = np.column_stack(
+            [np.zeros(n_cells), ranks, np.full(n_cells, self.n_samples - 1.0)]
+        )
+
+        results = np.empty((len(output_quantiles), n_cells))
+        for i, q in enumerate(output_quantiles):
+            rank = q * (self.n_samples - 1)
+            upper = np.minimum((ranks <= rank).sum(axis=1, keepdims=True), ranks.shape[1] - 1)
+            lower = upper - 1
+            lower_rank, upper_rank = (np.take_along_axis(ranks, j, 1) for j in (lower, upper))
+            lower_mean, upper_mean = (np.take_along_axis(means, j, 1) for j in (lower, upper))
+            span = np.maximum(upper_rank - lower_rank, 1e-12)
+            frac = np.clip((rank - lower_rank) / span, 0.0, 1.0)
+            results[i] = (lower_mean + frac * (upper_mean - lower_mean))[:, 0]
+        return results.reshape(len(output_quantiles), *self.shape)
+
+
+def quantiles_for_samples_streamed(
+    bcm: BayesianCompartmentalModel,
+    samples,
+    chunk_size: int = 100,
+    outputs: List[str] = None,
+    output_quantiles: List[float] = quantiles,
+    solver: str = None,
+    compression: int = 200,
+    max_exact: int = 1000,
+) -> pd.DataFrame:
+    """
+    Calculates quantiles of the model outputs over the samples (e.g. a posterior projection),
+    summarising each chunk of the batched runs as it is produced rather than holding the
+    results of all the samples, so that peak memory doesn't grow with the number of samples.
+    The quantiles are exact for up to max_exact samples; see StreamingQuantiles.
+
+    Args:
+        bcm: The Bayesian compartmental model to run.
+        samples: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        chunk_size: Number of samples evaluated in each vectorised call.
+        outputs: Derived outputs to summarise; all saved outputs if None.
+        output_quantiles: The quantiles to calculate.
+        solver: summer2 solver for the batched runs; see get_batch_runner.
+        compression: Number of t-digest centroids for each time and output.
+        max_exact: Number of samples up to which the quantiles are calculated exactly.
+
+    Returns:
+        DataFrame with time as index and (variable, quantile) as columns, as returned by
+        esamp.quantiles_for_results.
+    """
+    samples = bcm.sample.convert(samples)
+    _, _, outputs = get_batch_runner(bcm, outputs, solver, get_runtime_params(bcm, samples))
+    times = get_result_times(bcm)
+    sketch = StreamingQuantiles(len(times), len(outputs), compression, max_exact)
+    for _, chunk_values in iter_samples_batched(bcm, samples, chunk_size, outputs, solver):
+        sketch.update(chunk_values)
+
+    values = sketch.get_quantiles(output_quantiles)  # (quantile, time, output)
+    columns = pd.MultiIndex.from_product(
+        [outputs, output_quantiles], names=["variable", "quantile"]
+    )
+    return pd.DataFrame(
+        values.transpose(1, 2, 0).reshape(len(times), -1),
+        index=pd.Index(times, name="time"),
+        columns=columns,
+    ).sort_index(axis=1)
@@ -1,6 +1,22 @@
 import arviz as az
 import pandas as pd
+import numpy as np
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, Tuple
+from estival.sampling import tools as esamp
+from estival.sampling.tools import SampleIterator, SampledResults
+from estival.model import BayesianCompartmentalModel
+
+from tbdynamics.calibration.batch import get_runtime_params
+
+logger = logging.getLogger(__name__)
 
 
 # Load all inference data for different COVID configurations
@@ -46,4 +62,383 @@ def load_extracted_idata(out_path, covid_configs):
         else:
             print(f"File {input_file} does not exist.")
 
-    return inference_data_dict
\ No newline at end of file
+    return inference_data_dict
+
+
+def get_model_cache_key(*components) -> str:
+    """
+    Hashes the inputs that determine a built model, so that a model which has already been
+    built and compiled can be looked up instead of being rebuilt.
+
+    Args:
+        components: The inputs to the model construction (e.g. fixed parameters, mixing matrix,
+            COVID effects), which must be JSON-serialisable or numpy arrays.
+
+    Returns:
+        A hex digest identifying this combination of inputs.
+    """
+
+    def serialise(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError(f"Cannot hash object of type {type(obj).__name__}")
+
+    serialised = json.dumps(components, sort_keys=True, default=serialise)
+    return hashlib.sha256(serialised.encode()).hexdigest()
+
+
+def set_sample_params(samples: SampleIterator, values: Dict[str, float]) -> SampleIterator:
+    """
+    Returns a copy of the samples with the given parameters set to the same value for every
+    sample, e.g. to switch a runtime scenario parameter on or off for a set of posterior draws.
+
+    Args:
+        samples: The samples (as returned by bcm.sample.convert).
+        values: Parameter values to add to (or overwrite in) every sample.
+
+    Returns:
+        A new SampleIterator with the same index as the input samples.
+    """
+    components = dict(samples.components)
+    for name, value in values.items():
+        components[name] = np.full(samples.clen, value, dtype=float)
+    return SampleIterator(components, index=samples.index)
+
+
+def concat_samples(samples_dict: Dict[str, SampleIterator], name: str) -> SampleIterator:
+    """
+    Stacks several sets of samples into one, so that they can be evaluated in a single call.
+    The returned index has an outer level (called name) holding the keys of samples_dict.
+
+    Args:
+        samples_dict: Samples to stack, keyed by e.g. scenario name.
+        name: Name of the new outer index level.
+
+    Returns:
+        A single SampleIterator containing all the samples.
+    """
+    keys = list(samples_dict)
+    # Only keep the parameters which are present in every set of samples
+    shared_params = [
+        k
+        for k in samples_dict[keys[0]].components
+        if all(k in samples_dict[key].components for key in keys)
+    ]
+    components = {
+        k: np.concatenate([samples_dict[key].components[k] for key in keys])
+        for k in shared_params
+    }
+    index = pd.MultiIndex.from_tuples(
+        [
+            (key, *(idx if isinstance(idx, tuple) else (idx,)))
+            for key in keys
+            for idx in samples_dict[key].index
+        ],
+        names=[name, *samples_dict[keys[0]].index.names],
+    )
+    return SampleIterator(components, index=index)
+
+
+def get_unique_samples(samples: SampleIterator) -> Tuple[SampleIterator, np.ndarray]:
+    """
+    Finds the distinct parameter sets among the samples, e.g. the draws repeated in an MCMC
+    trace wherever a proposal was rejected.
+
+    Args:
+        samples: The samples (as returned by bcm.sample.convert).
+
+    Returns:
+        The first sample with each distinct parameter set (keeping its index), and the position
+        in these unique samples of every input sample.
+    """
+    param_array = np.column_stack(
+        [
+            np.asarray(values, dtype=float).reshape(samples.clen, -1)
+            for values in samples.components.values()
+        ]
+    )
+    _, first_idx, inverse = np.unique(
+        param_array, axis=0, return_index=True, return_inverse=True
+    )
+    # Keep the unique samples in the order they first appear
+    order = np.argsort(first_idx)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    unique_samples = samples[samples.index[first_idx[order]]]
+    return unique_samples, rank[inverse.ravel()]
+
+
+def model_results_for_unique_samples(
+    samples, bcm: BayesianCompartmentalModel, include_extras: bool = True
+) -> SampledResults:
+    """
+    Drop-in replacement for esamp.model_results_for_samples, which runs the model once for each
+    distinct parameter set among the samples and copies the results to the samples repeating it.
+    The number of model runs saved is logged at INFO level.
+    As with estival's runner, only the parameters with priors can vary between the samples, so
+    samples setting other model parameters (e.g. from get_detection_scaleup_params) have to be
+    run with run_samples_batched instead.
+
+    Args:
+        samples: Any sample container accepted by bcm.sample.convert (e.g. InferenceData).
+        bcm: The Bayesian compartmental model to run.
+        include_extras: Whether to calculate the log-likelihoods etc. of each sample.
+
+    Returns:
+        The results for every sample, as from esamp.model_results_for_samples.
+    """
+    samples = bcm.sample.convert(samples)
+    runtime_params = get_runtime_params(bcm, samples)
+    if runtime_params:
+        raise ValueError(
+            f"Parameters without priors {runtime_params} can't vary in estival's runner; "
+            "use run_samples_batched"
+        )
+    unique_samples, unique_pos = get_unique_samples(samples)
+    n_samples, n_unique = samples.clen, unique_samples.clen
+    logger.info(
+        "Running %d unique parameter sets for %d samples (%d runs saved)",
+        n_unique,
+        n_samples,
+        n_samples - n_unique,
+    )
+    unique_results = esamp.model_results_for_samples(unique_samples, bcm, include_extras)
+    if n_unique == n_samples:
+        return unique_results
+
+    # The unique sample providing the results of each sample
+    source_index = unique_samples.index[unique_pos]
+    sample_index = samples.index
+    if not isinstance(sample_index, pd.MultiIndex):
+        sample_index = pd.MultiIndex.from_arrays(
+            [sample_index], names=[sample_index.name or "sample"]
+        )
+        source_index = pd.MultiIndex.from_arrays([source_index], names=sample_index.names)
+
+    variables = unique_results.results.columns.unique("variable")
+    results = unique_results.results.reindex(
+        columns=pd.MultiIndex.from_tuples(
+            [(var, *idx) for var in variables for idx in source_index],
+            names=unique_results.results.columns.names,
+        )
+    )
+    results.columns = pd.MultiIndex.from_tuples(
+        [(var, *idx) for var in variables for idx in sample_index],
+        names=unique_results.results.columns.names,
+    )
+    results = results.sort_index(axis=1)
+
+    extras = None
+    if include_extras:
+        extras = unique_results.extras.loc[unique_samples.index[unique_pos]]
+        extras.index = samples.index
+        extras = extras.sort_index()
+    return SampledResults(results, extras)
+
+
+def get_detection_scaleup_params(
+    multiplier: float, start_time: float = 2025.0, end_time: float = 2035.0
+) -> Dict[str, float]:
+    """
+    Gets the parameter values for an improved detection scenario, for use with a model built
+    with runtime_detection=True. A multiplier of 1.0 gives the baseline (no improvement).
+    Unless they are calibrated, these are not priors of the model, so they are only varied
+    between samples by the batched runners (see get_runtime_params).
+
+    Args:
+        multiplier: Multiplier applied to the detection rate once the scale-up is complete.
+        start_time: Year the linear scale-up starts.
+        end_time: Year the scale-up reaches the full multiplier.
+
+    Returns:
+        The improved detection parameters for this scenario.
+    """
+    return {
+        "improved_detection_multiplier": multiplier,
+        "improved_detection_start": start_time,
+        "improved_detection_end": end_time,
+    }
+
+
+def check_output_grid_thinning(
+    reference_bcm: BayesianCompartmentalModel,
+    thinned_bcm: BayesianCompartmentalModel,
+    samples,
+) -> pd.DataFrame:
+    """
+    Compares a model whose output grid has been thinned (with an output_step_schedule)
+    against the same model on the uniform model time grid, at the times of each
+    calibration target.
+
+    Args:
+        reference_bcm: The model on the uniform time grid.
+        thinned_bcm: The model with the thinned output grid.
+        samples: Parameter sets to compare over, in any container accepted by
+            bcm.sample.convert (e.g. a few posterior draws).
+
+    Returns:
+        The maximum relative difference for each target over all the samples, along with the
+        maximum absolute difference in the log-likelihood.
+    """
+    samples = reference_bcm.sample.convert(samples)
+    differences = {name: 0.0 for name in reference_bcm.targets}
+    differences["loglikelihood"] = 0.0
+    for _, params in samples.iterrows():
+        reference = reference_bcm.run(params, include_extras=True)
+        thinned = thinned_bcm.run(params, include_extras=True)
+        for name, target in reference_bcm.targets.items():
+            times = target.data.index
+            ref_vals = reference.derived_outputs[target.model_key].loc[times]
+            thinned_vals = thinned.derived_outputs[target.model_key].loc[times]
+            rel_diff = (thinned_vals / ref_vals - 1.0).abs().max()
+            differences[name] = max(differences[name], rel_diff)
+        ll_diff = abs(
+            thinned.extras["loglikelihood"] - reference.extras["loglikelihood"]
+        )
+        differences["loglikelihood"] = max(differences["loglikelihood"], ll_diff)
+    return pd.Series(differences, name="max_difference").to_frame()
+
+
+def benchmark_run_time(
+    bcms: Dict[str, BayesianCompartmentalModel],
+    parameters: Dict[str, float],
+    n_runs: int = 20,
+) -> pd.DataFrame:
+    """
+    Compares the per-run cost (of a likelihood evaluation) of alternative builds of a model,
+    e.g. with different output profiles or output grids, once each has been compiled.
+
+    Args:
+        bcms: The Bayesian compartmental models to compare, by label.
+        parameters: Values of the calibrated parameters to run with.
+        n_runs: Number of runs timed for each model.
+
+    Returns:
+        DataFrame of the median run time (seconds) and the speed-up relative to the first model.
+    """
+    for bcm in bcms.values():
+        bcm.loglikelihood(**parameters)
+
+    # Alternate between the models, so that they are equally affected by any background load
+    run_times = {label: [] for label in bcms}
+    for _ in range(n_runs):
+        for label, bcm in bcms.items():
+            start = perf_counter()
+            bcm.loglikelihood(**parameters)
+            run_times[label].append(perf_counter() - start)
+    timings = pd.Series({k: np.median(v) for k, v in run_times.items()}, name="seconds")
+    timings = timings.to_frame()
+    timings["speed_up"] = timings["seconds"].iloc[0] / timings["seconds"]
+    return timings
+
+
+class CachedLogPosterior:
+    """
+    Bounded LRU cache around a model's log-posterior (or another objective of the parameters),
+    for optimisers that propose the same parameter sets repeatedly.
+    Parameter values are rounded to a number of significant digits to form the cache keys, so
+    that proposals differing only by floating point noise share an entry. The cache can be
+    shared between threads (e.g. the workers of optimize_model and of parallel multi-start
+    optimisations), and a point that is already being evaluated by another thread is waited
+    for rather than simulated again.
+
+    Args:
+        bcm: The Bayesian compartmental model.
+        maxsize: Maximum number of cached values, beyond which the least recently used are dropped.
+        significant_digits: Significant digits of the parameter values kept in the keys.
+        func: The objective to cache; bcm.logposterior if None.
+    """
+
+    def __init__(
+        self,
+        bcm: BayesianCompartmentalModel,
+        maxsize: int = 100000,
+        significant_digits: int = 12,
+        func: Callable = None,
+    ):
+        self.func = func or bcm.logposterior
+        self.maxsize = maxsize
+        self.significant_digits = significant_digits
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, parameters: Dict[str, float]) -> Tuple:
+        """
+        Gets the cache key of a set of parameter values.
+
+        Args:
+            parameters: The parameter values.
+
+        Returns:
+            The names and quantised values of the parameters.
+        """
+        return tuple(
+            (
+                name,
+                tuple(
+                    float(f"{value:.{self.significant_digits}g}")
+                    for value in np.ravel(np.asarray(parameters[name], dtype=float))
+                ),
+            )
+            for name in sorted(parameters)
+        )
+
+    def __call__(self, **parameters) -> float:
+        key = self.get_key(parameters)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            future = self._pending.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not is_owner:
+            return future.result()
+        try:
+            value = float(self.func(**parameters))
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+            del self._pending[key]
+        future.set_result(value)
+        return value
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Proportion of the calls so far that did not need a model run.
+        """
+        n_calls = self.hits + self.misses
+        return self.hits / n_calls if n_calls else 0.0
+
+    def cache_info(self) -> Dict[str, float]:
+        """
+        Gets the cache statistics.
+
+        Returns:
+            The numbers of hits and misses, the hit rate and the number of cached values.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate,
+                "size": len(self._cache),
+            }
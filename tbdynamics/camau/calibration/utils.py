@@ -6,18 +6,72 @@ import arviz as az
 import pandas as pd
 from typing import List, Dict
 from tbdynamics.camau.model import build_model
+from tbdynamics.camau.outputs import output_profiles
 from tbdynamics.tools.inputs import load_params, load_targets, matrix
+from tbdynamics.tools.equilibrium import get_burn_in_state
 from tbdynamics.constants import quantiles, covid_configs
 from tbdynamics.settings import CM_PATH
+from tbdynamics.calibration.utils import (
+    get_model_cache_key,
+    set_sample_params,
+    model_results_for_unique_samples,
+    get_detection_scaleup_params,
+)
+from tbdynamics.calibration.batch import batch_results_to_df, run_samples_batched
+from tbdynamics.calibration.likelihood import get_target_times
+from tbdynamics.calibration.summary import calculate_diff_quantiles, get_diff_quantile_tables
+from tbdynamics.calibration.scenarios import (
+    ScenarioSpec,
+    cumulative_indicators,
+    get_detection_scenario_name,
+    run_scenario_matrix,
+    get_cumulative_yearly,
+    get_diff_quantiles,
+)
 from pathlib import Path
 import xarray as xr
 import numpy as np
 
-def get_bcm(params, covid_effects = None, improved_detection_multiplier = None, homo_mixing=True) -> BayesianCompartmentalModel:
+_bcm_cache = {}
+
+
+def get_bcm(params, covid_effects = None, improved_detection_multiplier = None, homo_mixing=True, use_cache=True, runtime_detection=False, calibrate_detection=False, equilibrium_init=False, equilibrium_reference=None, output_step_schedule=None, output_times=None, output_profile="full", likelihood_only=False) -> BayesianCompartmentalModel:
     """
     Constructs and returns a Bayesian Compartmental Model.
+    Built models are cached for the lifetime of the process, so that repeated calls with the
+    same inputs (e.g. inside scenario loops) reuse the already built and compiled model.
     Parameters:
     - params (dict): A dictionary containing fixed parameters for the model.
+    - use_cache (bool): Whether to look up and store the model in the process-wide cache.
+    - runtime_detection (bool): If True, the improved detection scale-up is driven by runtime
+      parameters (see get_detection_scaleup_params) instead of improved_detection_multiplier, so
+      that any number of detection scenarios can be run against one compiled model. The
+      parameters are fixed at the baseline (no improvement) unless set in params, and are only
+      varied between samples by the batched runners (see get_runtime_params), so the priors
+      and posterior are those of the model without them.
+    - calibrate_detection (bool): If True (with runtime_detection), the improved detection
+      scale-up parameters are calibrated instead, with uninformative priors.
+    - equilibrium_init (bool): If True, the model starts from its endemic equilibrium at
+      equilibrium_time_start (see params.yml) instead of running in from time_start. The
+      equilibrium is found from the state reached by one burn-in run from time_start, which also
+      sets the population size at that time (see get_burn_in_state).
+    - equilibrium_reference (dict): Values of the calibrated parameters for that burn-in run
+      (e.g. a posterior draw); the medians of their priors if None. The population size doesn't
+      vary with the other parameter values, so the equilibrium start only reproduces the targets
+      of the full run close to the reference values.
+    - output_step_schedule (dict): Spacing of the output grid by start time (e.g. {1800.0: 1.0,
+      1950.0: 0.1}), to thin the results over the run-in period (see check_output_grid_thinning).
+      This is not a solver time step: the adaptive solver still chooses its own steps, and the
+      fixed-step solvers can't be used with it.
+    - output_times (list): Times at which to record the derived outputs (e.g. integer years),
+      which must include the target times; every model time if None.
+    - output_profile (str): The derived outputs to calculate, from output_profiles in outputs.py
+      ("scenario" for the scenario analyses, or "full"). This only affects the full runs (e.g.
+      bcm.run and run_samples_batched), as the likelihood is always evaluated from the target
+      outputs alone.
+    - likelihood_only (bool): If True, bcm.run only returns the target outputs, recorded at the
+      target times (overriding output_times), for models that are just used to evaluate the
+      likelihood (see calculate_pointwise_loglikelihood).
 
     Returns:
     - BayesianCompartmentalModel: An instance of the BayesianCompartmentalModel class, ready for
@@ -25,26 +79,85 @@ def get_bcm(params, covid_effects = None, improved_detection_multiplier = None,
       and fixed parameters, prior distributions for Bayesian inference, and target data for model
       validation or calibration.
     """
+    if calibrate_detection and not runtime_detection:
+        raise ValueError("calibrate_detection requires runtime_detection")
     params = params or {}
+    if runtime_detection:
+        params = get_detection_scaleup_params(1.0) | params
     fixed_params = load_params(CM_PATH / "params.yml")
     matrix_homo = np.ones((6, 6))
-    matrix = matrix_homo if homo_mixing else matrix
-    priors = get_all_priors(covid_effects)
+    mixing_matrix = matrix_homo if homo_mixing else matrix
+    targets = get_targets()
+    if likelihood_only:
+        output_times = get_target_times(targets)
+    cache_key = get_model_cache_key(
+        params,
+        fixed_params,
+        mixing_matrix,
+        covid_effects,
+        improved_detection_multiplier,
+        runtime_detection,
+        calibrate_detection,
+        equilibrium_init,
+        equilibrium_reference,
+        output_step_schedule,
+        output_times,
+        output_profile,
+        likelihood_only,
+    )
+    if use_cache and cache_key in _bcm_cache:
+        return _bcm_cache[cache_key]
+
+    priors = get_all_priors(covid_effects, calibrate_detection)
     # contact_prior = esp.UniformPrior("contact_rate", (0.06, 300.0) if homo_mixing else (0.001, 0.05))
     priors.insert(0, esp.UniformPrior("contact_rate", (1.0, 50.0) if homo_mixing else (0.001, 0.05)))# Inserts at the first position in the list
-    targets = get_targets()
+    equilibrium_start = None
+    if equilibrium_init:
+        burn_in_model = build_model(
+            fixed_params | {"time_end": fixed_params["equilibrium_time_start"]},
+            mixing_matrix,
+            covid_effects,
+            improved_detection_multiplier,
+            runtime_detection,
+        )
+        reference = {p.name: float(p.ppf(0.5)) for p in priors} | (equilibrium_reference or {})
+        equilibrium_start = get_burn_in_state(burn_in_model, params | reference)
     tb_model = build_model(
         fixed_params,
-        matrix,
+        mixing_matrix,
         covid_effects,
-        improved_detection_multiplier
+        improved_detection_multiplier,
+        runtime_detection,
+        equilibrium_start,
+        output_step_schedule,
+        output_times,
+        output_profile,
     )
-    return BayesianCompartmentalModel(tb_model, params, priors, targets)
+    if likelihood_only:
+        whitelist = [target.model_key for target in targets]
+    else:
+        whitelist = output_profiles[output_profile]
+    bcm = BayesianCompartmentalModel(tb_model, params, priors, targets, whitelist=whitelist)
+    if use_cache:
+        _bcm_cache[cache_key] = bcm
+    return bcm
+
+
+def clear_bcm_cache():
+    """
+    Empties the process-wide cache of built models, e.g. after editing params.yml or the inputs.
+    """
+    _bcm_cache.clear()
 
 
-def get_all_priors(covid_effects) -> List:
+def get_all_priors(covid_effects, calibrate_detection=False) -> List:
     """Get all priors used in any of the analysis types.
 
+    Args:
+        covid_effects: The COVID effects included in the model.
+        calibrate_detection: Whether to calibrate the improved detection scale-up parameters
+            of a model built with runtime_detection, with uninformative priors.
+
     Returns:
         All the priors used under any analyses
     """
@@ -87,6 +200,14 @@ def get_all_priors(covid_effects) -> List:
         priors.append(esp.UniformPrior("contact_reduction", (0.01, 0.8)))
     if covid_effects["detection_reduction"]:
         priors.append(esp.UniformPrior("detection_reduction", (0.01, 0.8)))
+    if calibrate_detection:
+        priors.extend(
+            [
+                esp.UniformPrior("improved_detection_multiplier", (1.0, 20.0)),
+                esp.UniformPrior("improved_detection_start", (2020.0, 2050.0)),
+                esp.UniformPrior("improved_detection_end", (2020.0, 2050.0)),
+            ]
+        )
     for prior in priors:
         prior._pymc_transform_eps_scale = 0.1
     return priors
@@ -125,12 +246,84 @@ def get_targets() -> List:
     ]
 
 
+def get_scenario_specs(
+    covid_config_names: List[str] = ["no_covid", "detection_and_contact", "detection"],
+    detection_multipliers: List[float] = [],
+    detection_config_name: str = "detection",
+    runtime_detection: bool = False,
+    output_profile: str = "scenario",
+) -> List[ScenarioSpec]:
+    """
+    Gets the scenarios for run_scenario_matrix, so that the COVID and improved detection
+    analyses can all be calculated from one set of runs.
+
+    Args:
+        covid_config_names: Names of the COVID configurations to run, as in covid_configs.
+        detection_multipliers: Multipliers for the improved detection scenarios.
+        detection_config_name: Name of the COVID configuration the improved detection scenarios
+            are built on, which is their comparator.
+        runtime_detection: Whether to run all the detection scenarios against one compiled model,
+            with the multiplier supplied as a runtime parameter.
+        output_profile: Name of the derived output profile of the models.
+
+    Returns:
+        The scenarios.
+    """
+    scenarios = [
+        ScenarioSpec(
+            config_name,
+            {"covid_effects": covid_configs[config_name], "output_profile": output_profile},
+        )
+        for config_name in covid_config_names
+    ]
+    detection_kwargs = {
+        "covid_effects": covid_configs[detection_config_name],
+        "output_profile": output_profile,
+    }
+    for multiplier in detection_multipliers:
+        scenario_name = get_detection_scenario_name(multiplier, detection_config_name)
+        if runtime_detection:
+            scenarios.append(
+                ScenarioSpec(
+                    scenario_name,
+                    {**detection_kwargs, "runtime_detection": True},
+                    get_detection_scaleup_params(multiplier),
+                )
+            )
+        else:
+            scenarios.append(
+                ScenarioSpec(
+                    scenario_name,
+                    {**detection_kwargs, "improved_detection_multiplier": multiplier},
+                )
+            )
+    return scenarios
+
+
+def get_covid_analysis_config(covid_analysis: int) -> str:
+    """
+    Gets the COVID configuration compared against the no COVID scenario in an analysis.
+
+    Args:
+        covid_analysis: Integer specifying which analysis to run (1 or 2).
+            - 1: Detection and contact reduction.
+            - 2: Detection reduction only.
+
+    Returns:
+        The name of the configuration, as in covid_configs.
+    """
+    if covid_analysis not in [1, 2]:
+        raise ValueError("Invalid value for covid_analysis. Must be 1 or 2.")
+    return {1: "detection_and_contact", 2: "detection"}[covid_analysis]
+
+
 def calculate_covid_diff_quantiles(
     params: Dict[str, float],
     idata_extract: az.InferenceData,
     indicators: List[str],
     years: List[int],
     covid_analysis: int = 1,
+    scenario_results: xr.DataArray = None,
 ) -> Dict[str, Dict[str, pd.DataFrame]]:
     """
     Run the models for the specified scenarios and calculate the absolute and relative differences.
@@ -144,64 +337,27 @@ def calculate_covid_diff_quantiles(
         covid_analysis: Integer specifying which analysis to run (1 or 2).
             - 1: Compare scenario 1 and scenario 0.
             - 2: Compare scenario 2 and scenario 0.
+        scenario_results: Results of run_scenario_matrix including the "no_covid" scenario and
+            that of the analysis, to reuse rather than running the models again.
 
     Returns:
         A dictionary containing two dictionaries:
         - "abs": Stores DataFrames for absolute differences (keyed by indicator name).
         - "rel": Stores DataFrames for relative differences (keyed by indicator name).
     """
-
-    # Validate that covid_analysis is either 1 or 2
-    if covid_analysis not in [1, 2]:
-        raise ValueError("Invalid value for covid_analysis. Must be 1 or 2.")
-    covid_scenarios = [
-        {"detection_reduction": False, "contact_reduction": False},  # No reduction
-        {
-            "detection_reduction": True,
-            "contact_reduction": True,
-        },  # With detection + contact reduction
-        {
-            "detection_reduction": True,
-            "contact_reduction": False,
-        },  # No contact reduction
-    ]
-    # Run models for the specified scenarios
-    scenario_results = []
-    for covid_effects in covid_scenarios:
-        bcm = get_bcm(params, covid_effects)
-        spaghetti_res = esamp.model_results_for_samples(idata_extract, bcm)
-        scenario_results.append(spaghetti_res.results)
-
-    # Calculate the differences based on the covid_analysis value
-    abs_diff = (
-        scenario_results[covid_analysis][indicators] - scenario_results[0][indicators]
-    )
-    rel_diff = abs_diff / scenario_results[0][indicators]
-
-    # Calculate the differences for each indicator and store them in DataFrames
-    diff_quantiles_abs = {}
-    diff_quantiles_rel = {}
-    for ind in indicators:
-        diff_quantiles_df_abs = pd.DataFrame(
-            {
-                quantile: [abs_diff[ind].loc[year].quantile(quantile) for year in years]
-                for quantile in quantiles
-            },
-            index=years,
-        )
-
-        diff_quantiles_df_rel = pd.DataFrame(
-            {
-                quantile: [rel_diff[ind].loc[year].quantile(quantile) for year in years]
-                for quantile in quantiles
-            },
-            index=years,
+    config_name = get_covid_analysis_config(covid_analysis)
+    if scenario_results is None:
+        scenario_results = run_scenario_matrix(
+            get_bcm,
+            params,
+            idata_extract,
+            get_scenario_specs(["no_covid", config_name], output_profile="full"),
+            indicators,
         )
+    return get_diff_quantiles(
+        scenario_results.sel(indicator=indicators), config_name, "no_covid", years
+    )
 
-        diff_quantiles_abs[ind] = diff_quantiles_df_abs
-        diff_quantiles_rel[ind] = diff_quantiles_df_rel
-
-    return {"abs": diff_quantiles_abs, "rel": diff_quantiles_rel}
 
 def calculate_covid_diff_cum_quantiles(
     params: Dict[str, float],
@@ -209,6 +365,7 @@ def calculate_covid_diff_cum_quantiles(
     cumulative_start_time: int = 2020,
     covid_analysis: int = 2,
     years: List[float] = [2021.0, 2022.0, 2025.0, 2030.0, 2035.0],
+    scenario_results: xr.DataArray = None,
 ) -> Dict[str, Dict[str, pd.DataFrame]]:
     """
     Run the models for the specified scenarios, calculate cumulative diseased and death values,
@@ -220,87 +377,23 @@ def calculate_covid_diff_cum_quantiles(
         cumulative_start_time: Year to start calculating the cumulative values.
         covid_analysis: Integer specifying which analysis to run (default is 2).
         years: List of years for which to calculate the differences.
+        scenario_results: Results of run_scenario_matrix including the "no_covid" scenario and
+            that of the analysis, to reuse rather than running the models again.
 
     Returns:
         A dictionary containing quantiles for absolute and relative differences between scenarios.
     """
-
-    # Validate that covid_analysis is either 1 or 2
-    if covid_analysis not in [1, 2]:
-        raise ValueError("Invalid value for covid_analysis. Must be 1 or 2.")
-
-    # Define the scenarios
-    covid_scenarios = [
-        {"detection_reduction": False, "contact_reduction": False},  # No reduction
-        {
-            "detection_reduction": True,
-            "contact_reduction": True,
-        },  # With detection + contact reduction
-        {
-            "detection_reduction": True,
-            "contact_reduction": False,
-        },  # No contact reduction
-    ]
-
-    scenario_results = []
-    for covid_effects in covid_scenarios:
-        # Get the model results
-        bcm = get_bcm(params, covid_effects)
-        spaghetti_res = esamp.model_results_for_samples(idata_extract, bcm).results
-
-        # Filter the results to include only the rows where the index (year) is an integer
-        yearly_data = spaghetti_res.loc[
-            (spaghetti_res.index >= cumulative_start_time) & 
-            (spaghetti_res.index % 1 == 0)
-        ]
-
-        # Calculate cumulative sums for each sample
-        cumulative_diseased_yearly = yearly_data['incidence_raw'].cumsum()
-        cumulative_deaths_yearly = yearly_data['mortality_raw'].cumsum()
-
-        # Store the cumulative results in the list
-        scenario_results.append({
-            "cumulative_diseased": cumulative_diseased_yearly,
-            "cumulative_deaths": cumulative_deaths_yearly,
-        })
-
-    # Calculate the differences based on the covid_analysis value
-    abs_diff = {
-        "cumulative_diseased": scenario_results[covid_analysis]["cumulative_diseased"] - scenario_results[0]["cumulative_diseased"],
-        "cumulative_deaths": scenario_results[covid_analysis]["cumulative_deaths"] - scenario_results[0]["cumulative_deaths"]
-    }
-    rel_diff = {
-        "cumulative_diseased": abs_diff["cumulative_diseased"] / scenario_results[0]["cumulative_diseased"],
-        "cumulative_deaths": abs_diff["cumulative_deaths"] / scenario_results[0]["cumulative_deaths"]
-    }
-
-    # Calculate quantiles for absolute and relative differences
-    diff_quantiles_abs = {}
-    diff_quantiles_rel = {}
-
-    for ind in ["cumulative_diseased", "cumulative_deaths"]:
-        # Calculate absolute difference quantiles
-        diff_quantiles_df_abs = pd.DataFrame(
-            {
-                quantile: [abs_diff[ind].loc[year].quantile(quantile) for year in years]
-                for quantile in quantiles
-            },
-            index=years,
-        )
-
-        # Calculate relative difference quantiles
-        diff_quantiles_df_rel = pd.DataFrame(
-            {
-                quantile: [rel_diff[ind].loc[year].quantile(quantile) for year in years]
-                for quantile in quantiles
-            },
-            index=years,
+    config_name = get_covid_analysis_config(covid_analysis)
+    if scenario_results is None:
+        scenario_results = run_scenario_matrix(
+            get_bcm,
+            params,
+            idata_extract,
+            get_scenario_specs(["no_covid", config_name]),
+            list(cumulative_indicators.values()),
         )
-
-        diff_quantiles_abs[ind] = diff_quantiles_df_abs
-        diff_quantiles_rel[ind] = diff_quantiles_df_rel
-
-    return {"abs": diff_quantiles_abs, "rel": diff_quantiles_rel}
+    cumulative_results = get_cumulative_yearly(scenario_results, cumulative_start_time)
+    return get_diff_quantiles(cumulative_results, config_name, "no_covid", years)
 
 
 def calculate_notifications_for_covid(
@@ -347,7 +440,7 @@ def calculate_notifications_for_covid(
     for scenario_name, covid_effects in covid_configs.items():
         # Run the model for the current scenario
         bcm = get_bcm(params, covid_effects)
-        model_results = esamp.model_results_for_samples(idata_extract, bcm)
+        model_results = model_results_for_unique_samples(idata_extract, bcm)
         spaghetti_res = model_results.results
         ll_res = model_results.extras  # Extract additional results (e.g., log-likelihoods)
         scenario_quantiles = esamp.quantiles_for_results(spaghetti_res, quantiles)
@@ -374,6 +467,7 @@ def calculate_scenario_outputs(
     idata_extract: az.InferenceData,
     indicators: List[str] = ['incidence', 'mortality_raw'],
     detection_multipliers: List[float] = [2.0, 5.0, 12.0],
+    runtime_detection: bool = False,
 ) -> Dict[str, Dict[str, pd.DataFrame]]:
     """
     Calculate the model results for each scenario with different detection multipliers
@@ -384,6 +478,8 @@ def calculate_scenario_outputs(
         idata_extract: InferenceData object containing the model data.
         indicators: List of indicators to return for the other scenarios (default: ['incidence', 'mortality_raw']).
         detection_multipliers: List of multipliers for improved detection to loop through (default: [2.0, 5.0, 12.0]).
+        runtime_detection: Whether to run all the detection scenarios against one compiled model,
+            with the multiplier supplied as a runtime parameter.
 
     Returns:
         A dictionary containing results for the baseline and each scenario.
@@ -394,7 +490,7 @@ def calculate_scenario_outputs(
 
     # Base scenario (calculate outputs for all indicators)
     bcm = get_bcm(params, scenario_config)
-    base_results = esamp.model_results_for_samples(idata_extract, bcm).results
+    base_results = model_results_for_unique_samples(idata_extract, bcm).results
     base_quantiles = esamp.quantiles_for_results(base_results, quantiles)
 
     # Store results for the baseline scenario
@@ -402,8 +498,15 @@ def calculate_scenario_outputs(
 
     # Calculate quantiles for each detection multiplier scenario
     for multiplier in detection_multipliers:
-        bcm = get_bcm(params, scenario_config, multiplier)
-        scenario_result = esamp.model_results_for_samples(idata_extract, bcm).results
+        if runtime_detection:
+            bcm = get_bcm(params, scenario_config, runtime_detection=True)
+            samples = set_sample_params(
+                bcm.sample.convert(idata_extract), get_detection_scaleup_params(multiplier)
+            )
+            scenario_result = batch_results_to_df(run_samples_batched(bcm, samples))
+        else:
+            bcm = get_bcm(params, scenario_config, multiplier)
+            scenario_result = model_results_for_unique_samples(idata_extract, bcm).results
         scenario_quantiles = esamp.quantiles_for_results(scenario_result, quantiles)
 
         # Store the results for this scenario
@@ -424,6 +527,8 @@ def calculate_scenario_diff_cum_quantiles(
     cumulative_start_time: int = 2020,
     scenario_choice: int = 2,
     years: List[int] = [2021, 2022, 2025, 2030, 2035],
+    runtime_detection: bool = False,
+    scenario_results: xr.DataArray = None,
 ) -> Dict[str, Dict[str, Dict[str, pd.DataFrame]]]:
     """
     Calculate the cumulative incidence and deaths for each scenario with different detection multipliers,
@@ -436,87 +541,42 @@ def calculate_scenario_diff_cum_quantiles(
         cumulative_start_time: Year to start calculating the cumulative values.
         scenario_choice: Integer specifying which scenario to use (1 or 2).
         years: List of years for which to calculate the quantiles.
+        runtime_detection: Whether to run all the detection scenarios against one compiled model,
+            with the multiplier supplied as a runtime parameter.
+        scenario_results: Results of run_scenario_matrix including the base scenario and its
+            improved detection scenarios, to reuse rather than running the models again.
 
     Returns:
         A dictionary containing the quantiles for absolute and relative differences between scenarios.
     """
-
-    # Set scenario configuration based on scenario_choice
-    if scenario_choice == 1:
-        scenario_config = {"detection_reduction": True, "contact_reduction": True}
-    elif scenario_choice == 2:
-        scenario_config = {"detection_reduction": True, "contact_reduction": False}
-    else:
+    if scenario_choice not in [1, 2]:
         raise ValueError("Invalid scenario_choice. Choose 1 or 2.")
+    config_name = get_covid_analysis_config(scenario_choice)
+    if scenario_results is None:
+        scenario_results = run_scenario_matrix(
+            get_bcm,
+            params,
+            idata_extract,
+            get_scenario_specs(
+                [config_name], detection_multipliers, config_name, runtime_detection
+            ),
+            list(cumulative_indicators.values()),
+        )
+    cumulative_results = get_cumulative_yearly(scenario_results, cumulative_start_time)
 
-    # Base scenario (without improved detection)
-    bcm = get_bcm(params, scenario_config)
-    base_results = esamp.model_results_for_samples(idata_extract, bcm).results
-
-    # Calculate cumulative sums for the base scenario
-    yearly_data_base = base_results.loc[
-        (base_results.index >= cumulative_start_time) & 
-        (base_results.index % 1 == 0)
-    ]
-    cumulative_diseased_base = yearly_data_base['incidence_raw'].cumsum()
-    cumulative_deaths_base = yearly_data_base['mortality_raw'].cumsum()
-
-    # Store results for each detection multiplier
-    detection_diff_results = {}
-
-    for multiplier in detection_multipliers:
-        # Improved detection scenario
-        bcm = get_bcm(params, scenario_config, multiplier)
-        scenario_result = esamp.model_results_for_samples(idata_extract, bcm).results
-
-        # Calculate cumulative sums for each scenario
-        yearly_data = scenario_result.loc[
-            (scenario_result.index >= cumulative_start_time) & 
-            (scenario_result.index % 1 == 0)
-        ]
-        cumulative_diseased = yearly_data['incidence_raw'].cumsum()
-        cumulative_deaths = yearly_data['mortality_raw'].cumsum()
-
-        # Calculate differences compared to the base scenario
-        abs_diff = {
-            "cumulative_diseased": cumulative_diseased - cumulative_diseased_base,
-            "cumulative_deaths": cumulative_deaths - cumulative_deaths_base,
-        }
-        rel_diff = {
-            "cumulative_diseased": abs_diff["cumulative_diseased"] / cumulative_diseased_base,
-            "cumulative_deaths": abs_diff["cumulative_deaths"] / cumulative_deaths_base,
-        }
-
-        # Calculate quantiles for absolute and relative differences
-        diff_quantiles_abs = {}
-        diff_quantiles_rel = {}
-
-        for ind in ["cumulative_diseased", "cumulative_deaths"]:
-            diff_quantiles_df_abs = pd.DataFrame(
-                {
-                    quantile: [abs_diff[ind].loc[year].quantile(quantile) for year in years]
-                    for quantile in quantiles
-                },
-                index=years,
-            )
-
-            diff_quantiles_df_rel = pd.DataFrame(
-                {
-                    quantile: [rel_diff[ind].loc[year].quantile(quantile) for year in years]
-                    for quantile in quantiles
-                },
-                index=years,
-            )
-
-            diff_quantiles_abs[ind] = diff_quantiles_df_abs
-            diff_quantiles_rel[ind] = diff_quantiles_df_rel
-
-        # Store the quantile results
-        scenario_key = f"increase_case_detection_by_{multiplier}".replace(".", "_")
-        detection_diff_results[scenario_key] = {
-            "abs": diff_quantiles_abs,
-            "rel": diff_quantiles_rel,
-        }
-
-    # Return the quantiles for absolute and relative differences
-    return detection_diff_results
\ No newline at end of file
+    # The quantiles of all the detection scenarios in one pass
+    scenario_names = {
+        f"increase_case_detection_by_{multiplier}".replace(".", "_"): get_detection_scenario_name(
+            multiplier, config_name
+        )
+        for multiplier in detection_multipliers
+    }
+    diff_tables = get_diff_quantile_tables(
+        calculate_diff_quantiles(
+            cumulative_results, config_name, years, list(scenario_names.values())
+        )
+    )
+    return {
+        scenario_key: diff_tables[scenario_name]
+        for scenario_key, scenario_name in scenario_names.items()
+    }
@@ -11,9 +11,40 @@ from tbdynamics.constants import (
 )
 
 
+# Derived outputs calculated for each use of the model (all the outputs if None)
+target_outputs = [
+    "total_population",
+    "notification",
+    "percentage_latent_adults",
+    "passive_notification_smear_positive",
+    "acf_detectionXact3_trialXorgan_pulmonary",
+    "acf_detectionXact3_controlXorgan_pulmonary",
+]
+output_profiles = {
+    "scenario": target_outputs
+    + [
+        "passive_notification",
+        "acf_notification",
+        "incidence",
+        "incidence_raw",
+        "mortality",
+        "mortality_raw",
+        "cumulative_diseased",
+        "cumulative_deaths",
+        "prevalence_pulmonary",
+        "adults_prevalence_pulmonary",
+        "percentage_latent",
+        "detection_rate",
+        *[f"prop_{compartment}" for compartment in compartments],
+    ],
+    "full": None,
+}
+
+
 def request_model_outputs(
     model: CompartmentalModel,
     detection_reduction,
+    output_profile: str = "full",
 ):
     """
     Requests various model outputs
@@ -25,6 +56,8 @@ def request_model_outputs(
         infectious_compartments: A list of infectious compartment names.
         age_strata: A list of age groups used for stratification.
         organ_strata: A list of organ strata used for stratification.
+        output_profile: Key of output_profiles; only the outputs of the profile (and those
+            they depend on) are calculated when the model is run.
     """
     # Request total population size
     total_population = model.request_output_for_compartments(
@@ -293,3 +326,7 @@ def request_model_outputs(
 
     model.add_computed_value_func("detection_rate", detection_func)
     model.request_computed_value_output("detection_rate")
+
+    profile_outputs = output_profiles[output_profile]
+    if profile_outputs:
+        model.set_derived_outputs_whitelist(profile_outputs)
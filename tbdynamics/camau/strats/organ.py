@@ -14,6 +14,7 @@ def get_organ_strat(
     fixed_params: Dict[str, any],
     detection_reduction,
     improved_detection_multiplier = None,
+    runtime_detection: bool = False,
 ) -> Stratification:
     """
     Creates and configures an organ stratification for the model. This includes defining
@@ -27,6 +28,9 @@ def get_organ_strat(
         fixed_params: A dictionary containing fixed parameters for the model, including
                       multipliers for infectiousness by organ, death rates by organ, and
                       incidence proportions for different organ involvements.
+        runtime_detection: If True, the improved detection scale-up is driven by the
+                      improved_detection_multiplier, improved_detection_start and
+                      improved_detection_end parameters rather than being fixed at build time.
 
     Returns:
         A Stratification object configured with organ-specific adjustments.
@@ -46,7 +50,12 @@ def get_organ_strat(
         ],
     )
     detection_func*= (get_sigmoidal_interpolation_function([2020.0, 2021.0, 2022.0], [1.0, 1.0 - Parameter("detection_reduction"), 1.0], curvature=8) if detection_reduction else 1.0)
-    if improved_detection_multiplier is not None:
+    if runtime_detection:
+        detection_func *= get_linear_interpolation_function(
+            [Parameter("improved_detection_start"), Parameter("improved_detection_end")],
+            [1.0, Parameter("improved_detection_multiplier")],
+        )
+    elif improved_detection_multiplier is not None:
         assert isinstance(improved_detection_multiplier, float) and improved_detection_multiplier > 0, "improved_detection_multiplier must be a positive float."
         detection_func *= get_linear_interpolation_function([2025.0, 2035.0], [1.0, improved_detection_multiplier])
 
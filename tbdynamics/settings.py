@@ -6,4 +6,5 @@ VN_PATH = BASE_PATH / "tbdynamics/vietnam"
 CM_PATH = BASE_PATH / "tbdynamics/camau"
 INPUT_PATH = DATA_PATH / "inputs"
 OUT_PATH = DATA_PATH / 'outputs'
+CACHE_PATH = DATA_PATH / 'cache'
 DOCS_PATH = BASE_PATH / 'docs'
\ No newline at end of file
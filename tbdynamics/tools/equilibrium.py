@@ -0,0 +1,114 @@
+from copy import deepcopy
+from typing import Dict
+import numpy as np
+import jax
+from jax import numpy as jnp
+from summer2 import CompartmentalModel
+from summer2.parameters import Parameter, Function
+
+
+def get_burn_in_state(model: CompartmentalModel, parameters: Dict[str, float]) -> np.ndarray:
+    """
+    Runs a model over its whole period (e.g. a burn-in ending at equilibrium_time_start)
+    and returns its compartment values at the end of it.
+
+    Args:
+        model: The model to run.
+        parameters: The parameter values to run with.
+
+    Returns:
+        The compartment values at the model's end time, in the order of model.compartments.
+    """
+    model.run(parameters)
+    return np.asarray(model.outputs[-1])
+
+
+def get_equilibrium_solver(
+    model: CompartmentalModel,
+    start_state: np.ndarray,
+    relax_steps: int = 25,
+    relax_step: float = 4.0,
+    newton_steps: int = 5,
+):
+    """
+    Builds a function finding the endemic equilibrium of a (fully stratified) model,
+    with all the rates frozen at the model's start time.
+    Because the population grows, the equilibrium is that of the compartment proportions,
+    i.e. the root of f(x) - x * sum(f(x)) with sum(x) = 1, where f is the model's vector field.
+    The disease-free state is also a root, and the large linearly implicit Euler steps used to
+    relax the proportions converge to whichever root is nearest, so the search starts from a
+    state with established infection (the compartment distribution reached by a burn-in run),
+    before polishing with Newton iterations.
+
+    Args:
+        model: The model, which is copied so that it can still be modified afterwards.
+        start_state: Compartment values to start the search from, e.g. from get_burn_in_state
+            for a model with the same structure; also sets the population size.
+        relax_steps: Number of relaxation steps.
+        relax_step: Size of the relaxation steps (in years).
+        newton_steps: Number of Newton iterations after the relaxation.
+
+    Returns:
+        Function of the model's parameter values (in sorted order of their names), returning
+        the equilibrium compartment values scaled to the population size of start_state.
+    """
+    structure_model = deepcopy(model)
+    param_names = sorted(structure_model.get_input_parameters())
+    runner = structure_model.get_runner({}, param_names, jit=False, include_full_outputs=False)
+    impl_dict = runner.impl_dict
+    start_time = structure_model.times[0]
+    start_state = np.asarray(start_state, dtype=float)
+    if start_state.shape != (len(structure_model.compartments),):
+        raise ValueError(
+            f"Start state has shape {start_state.shape}, but the model has "
+            f"{len(structure_model.compartments)} compartments"
+        )
+    population_size = start_state.sum()
+    start_props = jnp.array(start_state / population_size)
+
+    def solve_equilibrium(*param_values):
+        parameters = dict(zip(param_names, param_values))
+        static_graph_vals = impl_dict["static_graph_func"](parameters=parameters)
+        model_data = impl_dict["get_model_data"](parameters)
+
+        def get_prop_rates(props):
+            rates = impl_dict["get_comp_rates"](props, start_time, static_graph_vals, model_data)
+            return rates - props * rates.sum()
+
+        def relax(props, _):
+            jacobian = jax.jacfwd(get_prop_rates)(props)
+            step_matrix = jnp.eye(len(props)) - relax_step * jacobian
+            return props + jnp.linalg.solve(step_matrix, relax_step * get_prop_rates(props)), None
+
+        def get_residual(props):
+            return get_prop_rates(props).at[0].set(props.sum() - 1.0)
+
+        def newton(props, _):
+            jacobian = jax.jacfwd(get_residual)(props)
+            return props - jnp.linalg.solve(jacobian, get_residual(props)), None
+
+        props, _ = jax.lax.scan(relax, start_props, None, length=relax_steps)
+        props, _ = jax.lax.scan(newton, props, None, length=newton_steps)
+        return props * population_size
+
+    return solve_equilibrium, param_names
+
+
+def set_equilibrium_population(
+    model: CompartmentalModel, start_state: np.ndarray, **solver_kwargs
+):
+    """
+    Sets the model's initial population to its endemic equilibrium at the start time,
+    so that the model can start at a later time without a long burn-in period.
+    The equilibrium is searched for from start_state, whose population size it keeps.
+    Must be called once the model has been fully stratified.
+
+    Args:
+        model: The model to set the initial population for.
+        start_state: Compartment values at the model's start time, e.g. from get_burn_in_state.
+        solver_kwargs: Passed on to get_equilibrium_solver.
+    """
+    solve_equilibrium, param_names = get_equilibrium_solver(model, start_state, **solver_kwargs)
+    model.init_population_with_graphobject(
+        Function(solve_equilibrium, [Parameter(p) for p in param_names])
+    )
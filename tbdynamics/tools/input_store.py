@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from tbdynamics.settings import INPUT_PATH
+
+STORE_VERSION = 1
+STORE_PATH = INPUT_PATH / f"store_v{STORE_VERSION}"
+
+# Source CSVs for each region's datasets, with the columns used as the index and the value columns
+input_datasets = {
+    "vietnam": {
+        "birth": {"file": "vn_birth.csv", "index": ["year"], "columns": ["value"]},
+        "cdr": {
+            "file": "vn_cdr.csv",
+            "index": ["Time", "Age"],
+            "columns": ["Population", "Deaths"],
+        },
+    },
+}
+
+
+def _write_atomic(path: Path, write_func):
+    # Write to a temporary file first, so other processes never see a partial file
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    write_func(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_manifest(store_path: Path) -> dict:
+    manifest_file = store_path / "manifest.json"
+    if manifest_file.exists():
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == STORE_VERSION:
+            return manifest
+    return {"version": STORE_VERSION, "datasets": {}}
+
+
+def _get_source_hash(csv_path: Path) -> str:
+    # Key on the content rather than the file times, which change on checkout or copy
+    with open(csv_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def add_dataset(
+    region: str,
+    name: str,
+    csv_path: Path,
+    index: List[str],
+    columns: List[str],
+    store_path: Path = STORE_PATH,
+):
+    """
+    Converts a CSV file to a dataset of the binary input store, with one .npy file per column
+    (strings are stored as fixed-width unicode, so that every column can be memory-mapped).
+
+    Args:
+        region: Region the dataset belongs to.
+        name: Name of the dataset within the region.
+        csv_path: Path to the source CSV file.
+        index: Columns forming the index of the dataset.
+        columns: Value columns of the dataset.
+        store_path: Root directory of the store.
+    """
+    csv_path = Path(csv_path)
+    data = pd.read_csv(csv_path, usecols=index + columns)
+    dataset_path = store_path / region / name
+    dataset_path.mkdir(parents=True, exist_ok=True)
+    for column in index + columns:
+        values = data[column].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+
+        def write_column(path):
+            with open(path, "wb") as f:
+                np.save(f, values)
+
+        _write_atomic(dataset_path / f"{column}.npy", write_column)
+
+    # Re-read the manifest just before writing, in case another dataset was added meanwhile
+    manifest = _read_manifest(store_path)
+    manifest["datasets"].setdefault(region, {})[name] = {
+        "source": csv_path.name,
+        "source_hash": _get_source_hash(csv_path),
+        "index": index,
+        "columns": columns,
+    }
+
+    def write_manifest(path):
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    _write_atomic(store_path / "manifest.json", write_manifest)
+
+
+def build_input_store(region: str = "vietnam", store_path: Path = STORE_PATH):
+    """
+    Converts all the source CSVs of a region to the binary input store.
+
+    Args:
+        region: The region, as in input_datasets.
+        store_path: Root directory of the store.
+    """
+    for name, spec in input_datasets[region].items():
+        add_dataset(
+            region, name, INPUT_PATH / spec["file"], spec["index"], spec["columns"], store_path
+        )
+
+
+def load_arrays(
+    name: str, region: str = "vietnam", store_path: Path = STORE_PATH
+) -> Dict[str, np.ndarray]:
+    """
+    Gets the memory-mapped column arrays of a dataset, so that processes reading the same
+    dataset share its pages rather than each parsing a copy.
+    Datasets listed in input_datasets are converted on first use, or when the content of
+    their source CSV has changed.
+
+    Args:
+        name: Name of the dataset.
+        region: Region of the dataset.
+        store_path: Root directory of the store.
+
+    Returns:
+        Read-only arrays of the index and value columns, by column name.
+    """
+    dataset = _read_manifest(store_path)["datasets"].get(region, {}).get(name)
+    spec = input_datasets.get(region, {}).get(name)
+    if spec and (
+        dataset is None
+        or dataset.get("source_hash") != _get_source_hash(INPUT_PATH / spec["file"])
+    ):
+        add_dataset(
+            region, name, INPUT_PATH / spec["file"], spec["index"], spec["columns"], store_path
+        )
+        dataset = _read_manifest(store_path)["datasets"][region][name]
+    if dataset is None:
+        raise KeyError(f"No dataset {name} for region {region} in the input store")
+
+    dataset_path = store_path / region / name
+    return {
+        column: np.load(dataset_path / f"{column}.npy", mmap_mode="r")
+        for column in dataset["index"] + dataset["columns"]
+    }
+
+
+def load_dataset(name: str, region: str = "vietnam", store_path: Path = STORE_PATH) -> pd.DataFrame:
+    """
+    Loads a dataset of the binary input store as a DataFrame, in the layout of the source CSV
+    read with its index columns set as the index.
+    The DataFrame is an in-memory copy, so it shares no memory with the store or with other
+    processes; use load_arrays for the memory-mapped columns.
+
+    Args:
+        name: Name of the dataset.
+        region: Region of the dataset.
+        store_path: Root directory of the store.
+
+    Returns:
+        The dataset.
+    """
+    arrays = load_arrays(name, region, store_path)
+    dataset = _read_manifest(store_path)["datasets"][region][name]
+
+    def to_pandas(values):
+        # Copy out of the memory map, with strings as objects as pd.read_csv gives them
+        return values.astype(object) if values.dtype.kind == "U" else np.array(values)
+
+    index = pd.MultiIndex.from_arrays(
+        [to_pandas(arrays[c]) for c in dataset["index"]], names=dataset["index"]
+    )
+    if len(dataset["index"]) == 1:
+        index = index.get_level_values(0)
+    return pd.DataFrame({c: to_pandas(arrays[c]) for c in dataset["columns"]}, index=index)
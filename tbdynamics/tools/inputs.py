@@ -1,21 +1,25 @@
 from pathlib import Path
+import os
+import hashlib
 import pandas as pd
 import yaml
 import numpy as np
 from typing import List
 from summer2.functions.time import get_sigmoidal_interpolation_function
-from tbdynamics.settings import INPUT_PATH
+from tbdynamics.settings import INPUT_PATH, CACHE_PATH
+from tbdynamics.tools.input_store import load_dataset
 
+# Version of the processing in process_death_rate, part of its cache key; increment it whenever
+# the processing changes, so that tables cached by the previous version are not reused
+DEATH_RATE_CACHE_VERSION = 1
 
 
-def get_birth_rate():
-    return pd.read_csv(Path(INPUT_PATH / "vn_birth.csv"), index_col=0)["value"]
+def get_birth_rate(region: str = "vietnam"):
+    return load_dataset("birth", region)["value"]
 
 
-def get_death_rate():
-    return pd.read_csv(
-        Path(INPUT_PATH / "vn_cdr.csv"), usecols=["Age", "Time", "Population", "Deaths"]
-    ).set_index(["Time", "Age"])
+def get_death_rate(region: str = "vietnam"):
+    return load_dataset("cdr", region)
 
 
 def get_immigration():
@@ -48,7 +52,10 @@ def process_death_rate(data: pd.DataFrame, age_strata: List[int], year_indices:
       with columns for each age stratum defined in `age_strata`. Each cell contains the
       death rate for that age stratum and year.
     """
-    years = set(data.index.get_level_values(0))
+    cache_file = CACHE_PATH / f"death_rates_{get_death_rate_key(data, age_strata, year_indices)}.pkl"
+    if cache_file.exists():
+        return pd.read_pickle(cache_file)
+
     age_groups = set(data.index.get_level_values(1))
 
     # Creating the new list
@@ -60,19 +67,46 @@ def process_death_rate(data: pd.DataFrame, age_strata: List[int], year_indices:
         for low, up in agegroup_request
     }
     agegroup_map[agegroup_request[-1][0]].append("100+")
-    mapped_rates = pd.DataFrame()
-    for year in years:
-        for agegroup in agegroup_map:
-            age_mask = [
-                i in agegroup_map[agegroup] for i in data.index.get_level_values(1)
-            ]
-            age_year_data = data.loc[age_mask].loc[year, :]
-            total = age_year_data.sum()
-            mapped_rates.loc[year, agegroup] = total["Deaths"] / total["Population"]
+
+    # Sum the deaths and population over the raw age groups within each stratum
+    stratum_map = {
+        group: stratum for stratum, groups in agegroup_map.items() for group in groups
+    }
+    strata = data.index.get_level_values(1).map(stratum_map)
+    totals = data[["Deaths", "Population"]].groupby(
+        [data.index.get_level_values(0), strata]
+    ).sum()
+    mapped_rates = (totals["Deaths"] / totals["Population"]).unstack()
+    mapped_rates = mapped_rates[list(agegroup_map)].rename_axis(index=None, columns=None)
     mapped_rates.index += 0.5
     death_df = mapped_rates.loc[year_indices]
+
+    CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    death_df.to_pickle(tmp_file)
+    os.replace(tmp_file, cache_file)  # Atomic, in case other processes build at the same time
     return death_df
 
+
+def get_death_rate_key(data: pd.DataFrame, age_strata: List[int], year_indices: List[float]) -> str:
+    """
+    Gets a checksum of the inputs to process_death_rate and of DEATH_RATE_CACHE_VERSION, for
+    looking up the processed table.
+
+    Args:
+        data: The mortality and population data.
+        age_strata: The starting age of each age stratum.
+        year_indices: The years for which death rates are requested.
+
+    Returns:
+        A hex digest identifying the inputs.
+    """
+    digest = hashlib.sha256(f"v{DEATH_RATE_CACHE_VERSION}".encode())
+    digest.update(pd.util.hash_pandas_object(data).values.tobytes())
+    digest.update(np.asarray(age_strata, dtype=float).tobytes())
+    digest.update(np.asarray(year_indices, dtype=float).tobytes())
+    return digest.hexdigest()[:16]
+
 def process_universal_death_rate(data: pd.DataFrame, year_indices: List[float] = None):
     """
     Calculates the universal death rate for all years and returns the latest available death rate.
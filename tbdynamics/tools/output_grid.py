@@ -0,0 +1,87 @@
+from typing import List
+import numpy as np
+import jax
+from jax import numpy as jnp
+from summer2 import CompartmentalModel
+from summer2.model import ModelResults
+from summer2.solver import SolverType
+
+
+# summer2's fixed-step solvers step through a uniform grid, taking the step from the first two
+# model times, so they can't follow a non-uniform time grid (e.g. from get_thinned_output_times)
+FIXED_STEP_SOLVERS = {SolverType.EULER, SolverType.RUNGE_KUTTA}
+
+
+class OutputGridModel(CompartmentalModel):
+    """
+    A CompartmentalModel that only records its outputs and derived outputs on a subset of
+    its times (e.g. integer years), while still integrating and calculating the derived
+    outputs (including cumulative outputs) over the full time grid.
+    """
+
+    _output_idx = None
+
+    def set_output_times(self, output_times: List[float]):
+        """
+        Sets the times at which results are recorded.
+
+        Args:
+            output_times: The output times, each of which must be one of the model times.
+        """
+        output_times = np.asarray(output_times, dtype=float)
+        output_idx = np.abs(self.times[None, :] - output_times[:, None]).argmin(axis=1)
+        missing = output_times[~np.isclose(self.times[output_idx], output_times)]
+        if len(missing):
+            raise ValueError(f"Output times not in the model times: {missing.tolist()}")
+        self._output_idx = np.unique(output_idx)
+
+    def get_output_times(self) -> np.ndarray:
+        """
+        Gets the times at which results are recorded.
+
+        Returns:
+            The output times.
+        """
+        return self.times if self._output_idx is None else self.times[self._output_idx]
+
+    def _get_ref_idx(self):
+        ref_idx = super()._get_ref_idx()
+        return ref_idx if self._output_idx is None else ref_idx[self._output_idx]
+
+    def get_runner(
+        self,
+        parameters: dict,
+        dyn_params: List = None,
+        jit=True,
+        include_full_outputs=True,
+        **backend_args,
+    ):
+        time_steps = np.diff(self.times)
+        if backend_args.get("solver") in FIXED_STEP_SOLVERS and not np.allclose(
+            time_steps, time_steps[0]
+        ):
+            raise ValueError(
+                f"The {backend_args['solver']} solver requires uniform model times, but the "
+                "output grid has been thinned (output_step_schedule); use the default adaptive "
+                "solver"
+            )
+        model_results = super().get_runner(
+            parameters, dyn_params, False, include_full_outputs, **backend_args
+        )
+        run_func = model_results.function
+        if self._output_idx is not None:
+            output_idx = jnp.array(self._output_idx)
+            full_run_func = run_func
+
+            def run_func(parameters):
+                results = full_run_func(parameters)
+                results["derived_outputs"] = {
+                    k: v[output_idx] for k, v in results["derived_outputs"].items()
+                }
+                if "outputs" in results:
+                    results["outputs"] = results["outputs"][output_idx]
+                return results
+
+        if jit:
+            run_func = jax.jit(run_func)
+        return ModelResults(self, run_func, model_results.impl_dict)
@@ -3,9 +3,10 @@ from jax import numpy as jnp
 import numpy as np
 from pathlib import Path
 import pandas as pd
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
-from typing import List
+from typing import List, Dict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
 
 def triangle_wave_func(
@@ -209,6 +210,43 @@ def get_target_from_name(
     """
     return next((t.data for t in targets if t.name == name), None)
 
+def get_thinned_output_times(
+    time_start: float,
+    time_end: float,
+    output_step_schedule: Dict[float, float],
+) -> np.ndarray:
+    """
+    Get a thinned grid of model times, with a different spacing from each time onwards,
+    e.g. {1800.0: 1.0, 1950.0: 0.1} for yearly times before 1950 and 0.1 afterwards.
+    This is not a solver time step: it only thins the grid of times on which the results
+    (and derived outputs) are calculated, while the default adaptive solver chooses its own
+    integration steps. summer2's fixed-step solvers ("euler", "rk4") step through the model
+    times assuming they are uniform, so they can't be used with a thinned grid
+    (OutputGridModel.get_runner raises if they are combined).
+
+    Args:
+        time_start: Start time of the model
+        time_end: End time of the model
+        output_step_schedule: Spacing of the times from each time until the next one in the schedule
+
+    Returns:
+        The output times
+    """
+    breaks = sorted(output_step_schedule)
+    assert breaks[0] <= time_start, "Output step schedule must start at or before the model start"
+    segment_starts = [max(b, time_start) for b in breaks] + [time_end]
+    times = [np.array([time_start])]
+    for i, seg_break in enumerate(breaks):
+        seg_start, seg_end = segment_starts[i], min(segment_starts[i + 1], time_end)
+        if seg_end <= seg_start:
+            continue
+        n_steps = round((seg_end - seg_start) / output_step_schedule[seg_break])
+        times.append(np.linspace(seg_start, seg_end, n_steps + 1)[1:])
+    
+    # Round off floating point error, so that times such as 2016.0 are found in the index
+    return np.round(np.concatenate(times), 8)
+
+
 def get_row_col_for_subplots(i_panel, n_cols):
     return int(np.floor(i_panel / n_cols)) + 1, i_panel % n_cols + 1
 
@@ -218,7 +256,7 @@ def get_standard_subplot_fig(
     n_cols: int, 
     titles: List[str],
     share_y: bool=False,
-) -> go.Figure:
+) -> "go.Figure":
     """Start a plotly figure with subplots off from standard formatting.
 
     Args:
@@ -229,6 +267,9 @@ def get_standard_subplot_fig(
     Returns:
         Figure with nothing plotted
     """
+    # Imported here, so that the model-building path doesn't depend on plotly
+    from plotly.subplots import make_subplots
+
     heights = [320, 600, 680]
     height = 680 if n_rows > 3 else heights[n_rows - 1]
     fig = make_subplots(n_rows, n_cols, subplot_titles=titles, vertical_spacing=0.1, horizontal_spacing=0.1, shared_yaxes=share_y)
@@ -281,4 +322,3 @@ def get_future_scenario():
 
     return scenarios
 
-
@@ -2,25 +2,104 @@ from estival.model import BayesianCompartmentalModel
 import estival.priors as esp
 import estival.targets as est
 from estival.sampling import tools as esamp
+from estival.sampling.tools import SampleIterator
 import arviz as az
 import pandas as pd
 from typing import List, Dict
 from tbdynamics.vietnam.model import build_model
+from tbdynamics.vietnam.outputs import output_profiles
 from tbdynamics.tools.inputs import load_params, load_targets, matrix
+from tbdynamics.tools.equilibrium import get_burn_in_state
 from tbdynamics.constants import quantiles, compartments, covid_configs
 from tbdynamics.settings import VN_PATH
-from tbdynamics.calibration.utils import load_extracted_idata
+from tbdynamics.calibration.utils import (
+    load_extracted_idata,
+    get_model_cache_key,
+    set_sample_params,
+    model_results_for_unique_samples,
+    concat_samples,
+    get_detection_scaleup_params,
+)
+from tbdynamics.calibration.batch import batch_results_to_df, run_samples_batched
+from tbdynamics.calibration.likelihood import (
+    get_target_times,
+    calculate_pointwise_loglikelihood,
+    get_loglikelihood_idata,
+)
+from tbdynamics.calibration.summary import calculate_diff_quantiles, get_diff_quantile_tables
+from tbdynamics.calibration.scenarios import (
+    ScenarioSpec,
+    cumulative_indicators,
+    get_detection_scenario_name,
+    run_scenario_matrix,
+    get_cumulative_yearly,
+    get_diff_quantiles,
+)
 import xarray as xr
 import numpy as np
 
 
+_bcm_cache = {}
+
+
 def get_bcm(
-    params, covid_effects=None, improved_detection_multiplier=None, extreme_transmission = False
+    params,
+    covid_effects=None,
+    improved_detection_multiplier=None,
+    extreme_transmission=False,
+    use_cache=True,
+    runtime_covid=False,
+    runtime_detection=False,
+    calibrate_detection=False,
+    equilibrium_init=False,
+    equilibrium_reference=None,
+    output_step_schedule=None,
+    output_times=None,
+    output_profile="full",
+    likelihood_only=False,
 ) -> BayesianCompartmentalModel:
     """
     Constructs and returns a Bayesian Compartmental Model.
+    Built models are cached for the lifetime of the process, so that repeated calls with the
+    same inputs (e.g. inside scenario loops) reuse the already built and compiled model.
     Parameters:
     - params (dict): A dictionary containing fixed parameters for the model.
+    - use_cache (bool): Whether to look up and store the model in the process-wide cache.
+    - runtime_covid (bool): If True, both COVID reductions are built into the model and exposed
+      as runtime parameters (a value of 0 meaning "off"), so that one compiled model serves all
+      the covid_configs. covid_effects is then ignored. Intended for evaluating posterior draws
+      (see get_covid_switch_params), not for calibration. The reduction priors then include
+      zero, so log-priors differ from those of each configuration's own model until corrected
+      with set_config_logprior.
+    - runtime_detection (bool): If True, the improved detection scale-up is driven by runtime
+      parameters (see get_detection_scaleup_params) instead of improved_detection_multiplier, so
+      that any number of detection scenarios can be run against one compiled model. The
+      parameters are fixed at the baseline (no improvement) unless set in params, and are only
+      varied between samples by the batched runners (see get_runtime_params), so the priors
+      and posterior are those of the model without them.
+    - calibrate_detection (bool): If True (with runtime_detection), the improved detection
+      scale-up parameters are calibrated instead, with uninformative priors.
+    - equilibrium_init (bool): If True, the model starts from its endemic equilibrium at
+      equilibrium_time_start (see params.yml) instead of running in from time_start. The
+      equilibrium is found from the state reached by one burn-in run from time_start, which also
+      sets the population size at that time (see get_burn_in_state).
+    - equilibrium_reference (dict): Values of the calibrated parameters for that burn-in run
+      (e.g. a posterior draw); the medians of their priors if None. The population size doesn't
+      vary with the other parameter values, so the equilibrium start only reproduces the targets
+      of the full run close to the reference values.
+    - output_step_schedule (dict): Spacing of the output grid by start time (e.g. {1800.0: 1.0,
+      1950.0: 0.1}), to thin the results over the run-in period (see check_output_grid_thinning).
+      This is not a solver time step: the adaptive solver still chooses its own steps, and the
+      fixed-step solvers can't be used with it.
+    - output_times (list): Times at which to record the derived outputs (e.g. integer years),
+      which must include the target times; every model time if None.
+    - output_profile (str): The derived outputs to calculate, from output_profiles in outputs.py
+      ("scenario" for the scenario analyses, or "full"). This only affects the full runs (e.g.
+      bcm.run and run_samples_batched), as the likelihood is always evaluated from the target
+      outputs alone.
+    - likelihood_only (bool): If True, bcm.run only returns the target outputs, recorded at the
+      target times (overriding output_times), for models that are just used to evaluate the
+      likelihood (see calculate_pointwise_loglikelihood).
 
     Returns:
     - BayesianCompartmentalModel: An instance of the BayesianCompartmentalModel class, ready for
@@ -28,19 +107,89 @@ def get_bcm(
       and fixed parameters, prior distributions for Bayesian inference, and target data for model
       validation or calibration.
     """
+    if calibrate_detection and not runtime_detection:
+        raise ValueError("calibrate_detection requires runtime_detection")
     params = params or {}
+    if runtime_detection:
+        params = get_detection_scaleup_params(1.0) | params
     fixed_params = load_params(VN_PATH / "params.yml")
+    targets = get_targets()
+    if likelihood_only:
+        output_times = get_target_times(targets)
+    cache_key = get_model_cache_key(
+        params,
+        fixed_params,
+        matrix,
+        covid_effects,
+        improved_detection_multiplier,
+        extreme_transmission,
+        runtime_covid,
+        runtime_detection,
+        calibrate_detection,
+        equilibrium_init,
+        equilibrium_reference,
+        output_step_schedule,
+        output_times,
+        output_profile,
+        likelihood_only,
+    )
+    if use_cache and cache_key in _bcm_cache:
+        return _bcm_cache[cache_key]
+
+    if runtime_covid:
+        covid_effects = {"detection_reduction": True, "contact_reduction": True}
+    priors = get_all_priors(covid_effects, runtime_covid, calibrate_detection)
+    equilibrium_start = None
+    if equilibrium_init:
+        burn_in_model = build_model(
+            fixed_params | {"time_end": fixed_params["equilibrium_time_start"]},
+            matrix,
+            covid_effects,
+            improved_detection_multiplier,
+            extreme_transmission,
+            runtime_detection,
+        )
+        reference = {p.name: float(p.ppf(0.5)) for p in priors} | (equilibrium_reference or {})
+        equilibrium_start = get_burn_in_state(burn_in_model, params | reference)
     tb_model = build_model(
-        fixed_params, matrix, covid_effects, improved_detection_multiplier, extreme_transmission
+        fixed_params,
+        matrix,
+        covid_effects,
+        improved_detection_multiplier,
+        extreme_transmission,
+        runtime_detection,
+        equilibrium_start,
+        output_step_schedule,
+        output_times,
+        output_profile,
     )
-    priors = get_all_priors(covid_effects)
-    targets = get_targets()
-    return BayesianCompartmentalModel(tb_model, params, priors, targets)
+    if likelihood_only:
+        whitelist = [target.model_key for target in targets]
+    else:
+        whitelist = output_profiles[output_profile]
+    bcm = BayesianCompartmentalModel(tb_model, params, priors, targets, whitelist=whitelist)
+    if use_cache:
+        _bcm_cache[cache_key] = bcm
+    return bcm
 
 
-def get_all_priors(covid_effects) -> List:
+def clear_bcm_cache():
+    """
+    Empties the process-wide cache of built models, e.g. after editing params.yml or the inputs.
+    """
+    _bcm_cache.clear()
+
+
+def get_all_priors(covid_effects, runtime_covid=False, calibrate_detection=False) -> List:
     """Get all priors used in any of the analysis types.
 
+    Args:
+        covid_effects: The COVID effects included in the model.
+        runtime_covid: Whether the COVID reductions are runtime switches; their priors then
+            include zero so that a switched-off reduction remains admissible.
+        calibrate_detection: Whether to calibrate the improved detection scale-up parameters
+            of a model built with runtime_detection, with uninformative priors.
+
     Returns:
         All the priors used under any analyses
     """
@@ -66,10 +215,19 @@ def get_all_priors(covid_effects) -> List:
         esp.GammaPrior.from_mode("time_to_screening_end_asymp", 2.0, 5.0),
         # esp.TruncNormalPrior("time_to_screening_end_asymp", 2, 0.5, (0.0, 10.0)),
     ]
+    reduction_range = (0.0, 0.8) if runtime_covid else (0.01, 0.8)
     if covid_effects["contact_reduction"]:
-        priors.append(esp.UniformPrior("contact_reduction", (0.01, 0.8)))
+        priors.append(esp.UniformPrior("contact_reduction", reduction_range))
     if covid_effects["detection_reduction"]:
-        priors.append(esp.UniformPrior("detection_reduction", (0.01, 0.8)))
+        priors.append(esp.UniformPrior("detection_reduction", reduction_range))
+    if calibrate_detection:
+        priors.extend(
+            [
+                esp.UniformPrior("improved_detection_multiplier", (1.0, 20.0)),
+                esp.UniformPrior("improved_detection_start", (2020.0, 2050.0)),
+                esp.UniformPrior("improved_detection_end", (2020.0, 2050.0)),
+            ]
+        )
     for prior in priors:
         prior._pymc_transform_eps_scale = 0.1
     return priors
@@ -107,11 +265,115 @@ def get_targets() -> List:
     ]
 
 
+def get_covid_switch_params(covid_effects: Dict[str, bool]) -> Dict[str, float]:
+    """
+    Gets the parameter values that switch off the COVID reductions which are not part of a
+    configuration, for use with a model built with runtime_covid=True.
+
+    Args:
+        covid_effects: The COVID configuration, e.g. an entry of covid_configs.
+
+    Returns:
+        The reduction parameters to set to zero for this configuration.
+    """
+    return {effect: 0.0 for effect, included in covid_effects.items() if not included}
+
+
+def set_config_logprior(
+    ll_res: pd.DataFrame, samples: SampleIterator, covid_effects: Dict[str, bool]
+) -> pd.DataFrame:
+    """
+    Replaces the priors of the COVID reductions in the log-prior and log-posterior of samples
+    evaluated with a runtime_covid=True model by those of the model built for their
+    configuration, in which switched-off reductions have no prior and included ones exclude
+    zero, so that the values match those of the configuration's own model.
+
+    Args:
+        ll_res: Log-likelihoods etc. of the samples, as in the extras of
+            esamp.model_results_for_samples.
+        samples: The samples of the configuration, with its switch parameters set.
+        covid_effects: The COVID configuration.
+
+    Returns:
+        ll_res with the corrected log-prior and log-posterior.
+    """
+    all_effects = {effect: True for effect in covid_effects}
+    runtime_priors = get_all_priors(all_effects, runtime_covid=True)
+    config_priors = get_all_priors(covid_effects)
+    correction = np.zeros(samples.clen)
+    for priors, sign in [(config_priors, 1.0), (runtime_priors, -1.0)]:
+        for prior in priors:
+            if prior.name in covid_effects:
+                values = np.asarray(samples.components[prior.name], dtype=float)
+                correction += sign * prior.logpdf(values)
+    correction = pd.Series(correction, index=samples.index).loc[ll_res.index].to_numpy()
+    ll_res = ll_res.copy()
+    ll_res["logprior"] += correction
+    ll_res["logposterior"] += correction
+    return ll_res
+
+
+def get_scenario_specs(
+    covid_config_names: List[str] = ["no_covid", "detection"],
+    detection_multipliers: List[float] = [],
+    extreme_transmission: bool = False,
+    runtime_detection: bool = False,
+    output_profile: str = "scenario",
+) -> List[ScenarioSpec]:
+    """
+    Gets the scenarios for run_scenario_matrix, so that the COVID and improved detection
+    analyses can all be calculated from one set of runs.
+    Improved detection scenarios are built on the "detection" COVID configuration, which is
+    their comparator.
+
+    Args:
+        covid_config_names: Names of the COVID configurations to run, as in covid_configs.
+        detection_multipliers: Multipliers for the improved detection scenarios.
+        extreme_transmission: Whether to run the improved detection scenarios with extreme transmission.
+        runtime_detection: Whether to run all the detection scenarios against one compiled model,
+            with the multiplier supplied as a runtime parameter.
+        output_profile: Name of the derived output profile of the models.
+
+    Returns:
+        The scenarios.
+    """
+    scenarios = [
+        ScenarioSpec(
+            config_name,
+            {"covid_effects": covid_configs[config_name], "output_profile": output_profile},
+        )
+        for config_name in covid_config_names
+    ]
+    detection_kwargs = {
+        "covid_effects": covid_configs["detection"],
+        "extreme_transmission": extreme_transmission,
+        "output_profile": output_profile,
+    }
+    for multiplier in detection_multipliers:
+        if runtime_detection:
+            scenarios.append(
+                ScenarioSpec(
+                    get_detection_scenario_name(multiplier),
+                    {**detection_kwargs, "runtime_detection": True},
+                    get_detection_scaleup_params(multiplier),
+                )
+            )
+        else:
+            scenarios.append(
+                ScenarioSpec(
+                    get_detection_scenario_name(multiplier),
+                    {**detection_kwargs, "improved_detection_multiplier": multiplier},
+                )
+            )
+    return scenarios
+
+
 def calculate_covid_diff_cum_quantiles(
     params: Dict[str, float],
     idata_extract: az.InferenceData,
     cumulative_start_time: float = 2020.0,
     years: List[float] = [2021.0, 2022.0, 2025.0, 2030.0, 2035.0],
+    scenario_results: xr.DataArray = None,
 ) -> Dict[str, Dict[str, pd.DataFrame]]:
     """
     Run the models for the specified scenarios, calculate cumulative diseased and death values,
@@ -121,87 +383,23 @@ def calculate_covid_diff_cum_quantiles(
         params: Dictionary containing model parameters.
         idata_extract: InferenceData object containing the model data.
         cumulative_start_time: Year to start calculating the cumulative values.
-        covid_analysis: Integer specifying which analysis to run (default is 2).
         years: List of years for which to calculate the differences.
+        scenario_results: Results of run_scenario_matrix including the "no_covid" and
+            "detection" scenarios, to reuse rather than running the models again.
 
     Returns:
         A dictionary containing quantiles for absolute and relative differences between scenarios.
     """
-
-    # Define the scenarios
-    covid_configs = [
-        {"detection_reduction": False, "contact_reduction": False},  # No reduction
-        {
-            "detection_reduction": True,
-            "contact_reduction": False,
-        },  # No contact reduction
-    ]
-
-    covid_results = []
-    for covid_effects in covid_configs:
-        # Get the model results
-        bcm = get_bcm(params, covid_effects)
-        spaghetti_res = esamp.model_results_for_samples(idata_extract, bcm).results
-
-        # Filter the results to include only the rows where the index (year) is an integer
-        yearly_data = spaghetti_res.loc[
-            (spaghetti_res.index >= cumulative_start_time)
-            & (spaghetti_res.index % 1 == 0)
-        ]
-
-        # Calculate cumulative sums for each sample
-        cumulative_diseased_yearly = yearly_data["incidence_raw"].cumsum()
-        cumulative_deaths_yearly = yearly_data["mortality_raw"].cumsum()
-
-        # Store the cumulative results in the list
-        covid_results.append(
-            {
-                "cumulative_diseased": cumulative_diseased_yearly,
-                "cumulative_deaths": cumulative_deaths_yearly,
-            }
-        )
-
-    # Calculate the differences based on the covid_analysis value
-    abs_diff = {
-        "cumulative_diseased": covid_results[1]["cumulative_diseased"]
-        - covid_results[0]["cumulative_diseased"],
-        "cumulative_deaths": covid_results[1]["cumulative_deaths"]
-        - covid_results[0]["cumulative_deaths"],
-    }
-    rel_diff = {
-        "cumulative_diseased": abs_diff["cumulative_diseased"]
-        / covid_results[0]["cumulative_diseased"],
-        "cumulative_deaths": abs_diff["cumulative_deaths"]
-        / covid_results[0]["cumulative_deaths"],
-    }
-
-    # Calculate quantiles for absolute and relative differences
-    diff_quantiles_abs = {}
-    diff_quantiles_rel = {}
-
-    for ind in ["cumulative_diseased", "cumulative_deaths"]:
-        # Calculate absolute difference quantiles
-        diff_quantiles_df_abs = pd.DataFrame(
-            {
-                quantile: [abs_diff[ind].loc[year].quantile(quantile) for year in years]
-                for quantile in quantiles
-            },
-            index=years,
-        )
-
-        # Calculate relative difference quantiles
-        diff_quantiles_df_rel = pd.DataFrame(
-            {
-                quantile: [rel_diff[ind].loc[year].quantile(quantile) for year in years]
-                for quantile in quantiles
-            },
-            index=years,
+    if scenario_results is None:
+        scenario_results = run_scenario_matrix(
+            get_bcm,
+            params,
+            idata_extract,
+            get_scenario_specs(["no_covid", "detection"]),
+            list(cumulative_indicators.values()),
         )
-
-        diff_quantiles_abs[ind] = diff_quantiles_df_abs
-        diff_quantiles_rel[ind] = diff_quantiles_df_rel
-
-    return {"abs": diff_quantiles_abs, "rel": diff_quantiles_rel}
+    cumulative_results = get_cumulative_yearly(scenario_results, cumulative_start_time)
+    return get_diff_quantiles(cumulative_results, "detection", "no_covid", years)
 
 
 def calculate_scenario_outputs(
@@ -209,7 +407,8 @@ def calculate_scenario_outputs(
     idata_extract: az.InferenceData,
     indicators: List[str] = ["incidence", "mortality_raw"],
     detection_multipliers: List[float] = [2.0, 5.0, 12.0],
-    extreme_transmission: bool = False
+    extreme_transmission: bool = False,
+    runtime_detection: bool = False,
 ) -> Dict[str, Dict[str, pd.DataFrame]]:
     """
     Calculate the model results for each scenario with different detection multipliers
@@ -220,6 +419,8 @@ def calculate_scenario_outputs(
         idata_extract: InferenceData object containing the model data.
         indicators: List of indicators to return for the other scenarios (default: ['incidence', 'mortality_raw']).
         detection_multipliers: List of multipliers for improved detection to loop through (default: [2.0, 5.0, 12.0]).
+        runtime_detection: Whether to run all the detection scenarios against one compiled model,
+            with the multiplier supplied as a runtime parameter.
 
     Returns:
         A dictionary containing results for the baseline and each scenario.
@@ -230,7 +431,7 @@ def calculate_scenario_outputs(
 
     # Base scenario (calculate outputs for all indicators)
     bcm = get_bcm(params, scenario_config, None, True)
-    base_results = esamp.model_results_for_samples(idata_extract, bcm).results
+    base_results = model_results_for_unique_samples(idata_extract, bcm).results
     base_quantiles = esamp.quantiles_for_results(base_results, quantiles)
     base_quantiles['percentage_latent'] = base_quantiles['percentage_latent'] *0.8
 
@@ -262,8 +463,17 @@ def calculate_scenario_outputs(
 
     # Calculate quantiles for each detection multiplier scenario
     for multiplier in detection_multipliers:
-        bcm = get_bcm(params, scenario_config, multiplier, extreme_transmission)
-        scenario_result = esamp.model_results_for_samples(idata_extract, bcm).results
+        if runtime_detection:
+            bcm = get_bcm(
+                params, scenario_config, None, extreme_transmission, runtime_detection=True
+            )
+            samples = set_sample_params(
+                bcm.sample.convert(idata_extract), get_detection_scaleup_params(multiplier)
+            )
+            scenario_result = batch_results_to_df(run_samples_batched(bcm, samples))
+        else:
+            bcm = get_bcm(params, scenario_config, multiplier, extreme_transmission)
+            scenario_result = model_results_for_unique_samples(idata_extract, bcm).results
         scenario_quantiles = esamp.quantiles_for_results(scenario_result, quantiles)
 
         # Store the results for this scenario
@@ -285,6 +495,8 @@ def calculate_scenario_diff_cum_quantiles(
     cumulative_start_time: int = 2020,
     extreme_transmission: bool = False,
     years: List[int] = [2021, 2022, 2025, 2030, 2035],
+    runtime_detection: bool = False,
+    scenario_results: xr.DataArray = None,
 ) -> Dict[str, Dict[str, Dict[str, pd.DataFrame]]]:
     """
     Calculate the cumulative incidence and deaths for each scenario with different detection multipliers,
@@ -295,99 +507,116 @@ def calculate_scenario_diff_cum_quantiles(
         idata_extract: InferenceData object containing the model data.
         detection_multipliers: List of multipliers for improved detection to loop through.
         cumulative_start_time: Year to start calculating the cumulative values.
-        scenario_choice: Integer specifying which scenario to use (1 or 2).
+        extreme_transmission: Whether to run the improved detection scenarios with extreme transmission.
         years: List of years for which to calculate the quantiles.
+        runtime_detection: Whether to run all the detection scenarios against one compiled model,
+            with the multiplier supplied as a runtime parameter.
+        scenario_results: Results of run_scenario_matrix including the "detection" scenario
+            and the improved detection scenarios, to reuse rather than running the models again
+            (extreme_transmission and runtime_detection are then those the results were run with).
 
     Returns:
         A dictionary containing the quantiles for absolute and relative differences between scenarios.
     """
+    if scenario_results is None:
+        scenario_results = run_scenario_matrix(
+            get_bcm,
+            params,
+            idata_extract,
+            get_scenario_specs(
+                ["detection"], detection_multipliers, extreme_transmission, runtime_detection
+            ),
+            list(cumulative_indicators.values()),
+        )
+    cumulative_results = get_cumulative_yearly(scenario_results, cumulative_start_time)
 
-    # Set scenario configuration based on scenario_choice
-
-    covid_config = {"detection_reduction": True, "contact_reduction": False}
-
-    # Base scenario (without improved detection)
-    bcm = get_bcm(params, covid_config)
-    base_results = esamp.model_results_for_samples(idata_extract, bcm).results
+    # The quantiles of all the detection scenarios in one pass
+    scenario_names = {
+        f"increase_case_detection_by_{multiplier}".replace(".", "_"): get_detection_scenario_name(
+            multiplier
+        )
+        for multiplier in detection_multipliers
+    }
+    diff_tables = get_diff_quantile_tables(
+        calculate_diff_quantiles(
+            cumulative_results, "detection", years, list(scenario_names.values())
+        )
+    )
+    return {
+        scenario_key: diff_tables[scenario_name]
+        for scenario_key, scenario_name in scenario_names.items()
+    }
 
-    # Calculate cumulative sums for the base scenario
-    yearly_data_base = base_results.loc[
-        (base_results.index >= cumulative_start_time) & (base_results.index % 1 == 0)
-    ]
-    cumulative_diseased_base = yearly_data_base["incidence_raw"].cumsum()
-    cumulative_deaths_base = yearly_data_base["mortality_raw"].cumsum()
 
-    # Store results for each detection multiplier
-    detection_diff_results = {}
+def run_model_for_covid(
+    params, output_dir, covid_configs, quantiles, runtime_covid=False, likelihood_only=False
+):
+    covid_outputs = {}
 
-    for multiplier in detection_multipliers:
-        # Improved detection scenario
-        bcm = get_bcm(params, covid_config, multiplier, extreme_transmission)
-        scenario_result = esamp.model_results_for_samples(idata_extract, bcm).results
-
-        # Calculate cumulative sums for each scenario
-        yearly_data = scenario_result.loc[
-            (scenario_result.index >= cumulative_start_time)
-            & (scenario_result.index % 1 == 0)
-        ]
-        cumulative_diseased = yearly_data["incidence_raw"].cumsum()
-        cumulative_deaths = yearly_data["mortality_raw"].cumsum()
+    # Load the extracted InferenceData
+    inference_data_dict = load_extracted_idata(output_dir, covid_configs)
 
-        # Calculate differences compared to the base scenario
-        abs_diff = {
-            "cumulative_diseased": cumulative_diseased - cumulative_diseased_base,
-            "cumulative_deaths": cumulative_deaths - cumulative_deaths_base,
+    if likelihood_only:
+        # Only evaluate the likelihood of the draws (e.g. for calculate_waic_comparison),
+        # returning the pointwise log-likelihoods instead of the indicator outputs
+        loaded_configs = {
+            covid_name: covid_effects
+            for covid_name, covid_effects in covid_configs.items()
+            if covid_name in inference_data_dict
         }
-        rel_diff = {
-            "cumulative_diseased": abs_diff["cumulative_diseased"]
-            / cumulative_diseased_base,
-            "cumulative_deaths": abs_diff["cumulative_deaths"] / cumulative_deaths_base,
-        }
-
-        # Calculate quantiles for absolute and relative differences
-        diff_quantiles_abs = {}
-        diff_quantiles_rel = {}
-
-        for ind in ["cumulative_diseased", "cumulative_deaths"]:
-            diff_quantiles_df_abs = pd.DataFrame(
-                {
-                    quantile: [
-                        abs_diff[ind].loc[year].quantile(quantile) for year in years
-                    ]
-                    for quantile in quantiles
-                },
-                index=years,
+        for covid_name in covid_configs:
+            if covid_name not in loaded_configs:
+                print(f"Skipping {covid_name} as no inference data was loaded.")
+        if runtime_covid:
+            # All the configurations in one vectorised pass through a single compiled model
+            bcm = get_bcm(params, runtime_covid=True, likelihood_only=True)
+            config_samples = {
+                covid_name: set_sample_params(
+                    bcm.sample.convert(inference_data_dict[covid_name]),
+                    get_covid_switch_params(covid_effects),
+                )
+                for covid_name, covid_effects in loaded_configs.items()
+            }
+            all_pointwise_ll, all_ll_res = calculate_pointwise_loglikelihood(
+                bcm, concat_samples(config_samples, "covid_config")
             )
-
-            diff_quantiles_df_rel = pd.DataFrame(
-                {
-                    quantile: [
-                        rel_diff[ind].loc[year].quantile(quantile) for year in years
-                    ]
-                    for quantile in quantiles
-                },
-                index=years,
+            config_level = all_ll_res.index.get_level_values("covid_config")
+        for covid_name, covid_effects in loaded_configs.items():
+            if runtime_covid:
+                in_config = np.asarray(config_level == covid_name)
+                pointwise_ll = {k: v[in_config] for k, v in all_pointwise_ll.items()}
+                ll_res = set_config_logprior(
+                    all_ll_res.xs(covid_name, level="covid_config"),
+                    config_samples[covid_name],
+                    covid_effects,
+                )
+            else:
+                bcm = get_bcm(params, covid_effects, likelihood_only=True)
+                pointwise_ll, ll_res = calculate_pointwise_loglikelihood(
+                    bcm, inference_data_dict[covid_name]
+                )
+            covid_outputs[covid_name] = {
+                "ll_res": ll_res,
+                "pointwise_ll": pointwise_ll,
+                "idata": get_loglikelihood_idata(bcm, pointwise_ll, ll_res),
+            }
+        return covid_outputs
+
+    if runtime_covid:
+        # Evaluate all the configurations in a single call against one compiled model,
+        # switching off the reductions which are not part of each configuration
+        bcm = get_bcm(params, runtime_covid=True)
+        config_samples = {
+            covid_name: set_sample_params(
+                bcm.sample.convert(inference_data_dict[covid_name]),
+                get_covid_switch_params(covid_effects),
             )
-
-            diff_quantiles_abs[ind] = diff_quantiles_df_abs
-            diff_quantiles_rel[ind] = diff_quantiles_df_rel
-
-        # Store the quantile results
-        scenario_key = f"increase_case_detection_by_{multiplier}".replace(".", "_")
-        detection_diff_results[scenario_key] = {
-            "abs": diff_quantiles_abs,
-            "rel": diff_quantiles_rel,
+            for covid_name, covid_effects in covid_configs.items()
+            if covid_name in inference_data_dict
         }
-
-    # Return the quantiles for absolute and relative differences
-    return detection_diff_results
-
-
-def run_model_for_covid(params, output_dir, covid_configs, quantiles):
-    covid_outputs = {}
-
-    # Load the extracted InferenceData
-    inference_data_dict = load_extracted_idata(output_dir, covid_configs)
+        all_results = model_results_for_unique_samples(
+            concat_samples(config_samples, "covid_config"), bcm
+        )
 
     for covid_name, covid_effects in covid_configs.items():
         # Load the inference data for this specific scenario
@@ -395,17 +624,25 @@ def run_model_for_covid(params, output_dir, covid_configs, quantiles):
             print(f"Skipping {covid_name} as no inference data was loaded.")
             continue
 
-        idata_extract = inference_data_dict[covid_name]
-
-        # Run the model for the current scenario
-        bcm = get_bcm(params, covid_effects)  # Adjust this function as needed
-        model_results = esamp.model_results_for_samples(idata_extract, bcm)
-
-        # Extract results from the model output
-        spaghetti_res = model_results.results
-        ll_res = (
-            model_results.extras
-        )  # Extract additional results (e.g., log-likelihoods)
+        if runtime_covid:
+            spaghetti_res = all_results.results.xs(covid_name, level="covid_config", axis=1)
+            ll_res = set_config_logprior(
+                all_results.extras.xs(covid_name, level="covid_config"),
+                config_samples[covid_name],
+                covid_effects,
+            )
+        else:
+            idata_extract = inference_data_dict[covid_name]
+
+            # Run the model for the current scenario
+            bcm = get_bcm(params, covid_effects)  # Adjust this function as needed
+            model_results = model_results_for_unique_samples(idata_extract, bcm)
+
+            # Extract results from the model output
+            spaghetti_res = model_results.results
+            ll_res = (
+                model_results.extras
+            )  # Extract additional results (e.g., log-likelihoods)
         scenario_quantiles = esamp.quantiles_for_results(spaghetti_res, quantiles)
 
         # Define the indicators you're interested in
@@ -451,30 +688,35 @@ def convert_ll_to_idata(ll_res):
     return idata
 
 
-def calculate_waic_comparison(covid_outputs):
-    waic_dict = {}
-
-    for covid_name, output in covid_outputs.items():
-        # Extract the log-likelihoods (ll_res) for the current scenario
-        ll_res = output["ll_res"]
+def calculate_waic_comparison(covid_outputs, ic="waic"):
+    """
+    Compares the COVID configurations by an information criterion.
+    Outputs of run_model_for_covid with likelihood_only=True hold the pointwise log-likelihood
+    of every target observation, which is used if present; otherwise the criterion is
+    calculated from the total log-likelihood of each draw.
 
-        # Convert ll_res to InferenceData
-        idata = convert_ll_to_idata(ll_res)
+    Args:
+        covid_outputs: Outputs of run_model_for_covid, by COVID configuration.
+        ic: The information criterion, "waic" or "loo" (PSIS-LOO).
 
-        # Store InferenceData in the dictionary for WAIC comparison
-        waic_dict[covid_name] = idata
+    Returns:
+        The comparison from az.compare.
+    """
+    ic_func = {"waic": az.waic, "loo": az.loo}[ic]
+    ic_dict = {}
 
-    # Compare the WAIC across all scenarios
-    waic_results = {
-        config_name: az.waic(idata) for config_name, idata in waic_dict.items()
-    }
+    for covid_name, output in covid_outputs.items():
+        if "idata" in output:
+            idata = output["idata"]
+        else:
+            # Convert the total log-likelihoods (ll_res) to InferenceData
+            idata = convert_ll_to_idata(output["ll_res"])
 
-    # Compare using az.compare
-    waic_comparison = az.compare(
-        waic_results, ic="waic"
-    )  # Using WAIC for information criterion
+        # Calculate the criterion for the current scenario
+        ic_dict[covid_name] = ic_func(idata)
 
-    return waic_comparison
+    # Compare the configurations using the criterion
+    return az.compare(ic_dict, ic=ic)
 
 
 def calculate_covid_cum_results(
@@ -482,6 +724,7 @@ def calculate_covid_cum_results(
     idata_extract: az.InferenceData,
     cumulative_start_time: float = 2020.0,
     years: List[float] = [2021.0, 2022.0, 2025.0, 2030.0, 2035.0],
+    scenario_results: xr.DataArray = None,
 ) -> Dict[str, Dict[str, pd.DataFrame]]:
     """
     Run the models for the specified scenarios, calculate cumulative diseased and death values,
@@ -492,48 +735,30 @@ def calculate_covid_cum_results(
         idata_extract: InferenceData object containing the model data.
         cumulative_start_time: Year to start calculating the cumulative values.
         years: List of years for which to calculate the results.
+        scenario_results: Results of run_scenario_matrix including the "no_covid" and
+            "detection" scenarios, to reuse rather than running the models again.
 
     Returns:
         A dictionary containing cumulative diseased and deaths results for each scenario.
     """
+    # Scenario names of the results and the matrix scenarios they come from
+    scenario_names = {"no_covid": "no_covid", "detection_reduction_only": "detection"}
+
+    if scenario_results is None:
+        scenario_results = run_scenario_matrix(
+            get_bcm,
+            params,
+            idata_extract,
+            get_scenario_specs(list(scenario_names.values())),
+            list(cumulative_indicators.values()),
+        )
+    cumulative_results = get_cumulative_yearly(scenario_results, cumulative_start_time)
+    cumulative_results = cumulative_results.sel(time=years)
 
-    # Define the scenarios with scenario names as keys
-    covid_configs = {
-        "no_covid": {
-            "detection_reduction": False,
-            "contact_reduction": False,
-        },  # No reduction
-        "detection_reduction_only": {
-            "detection_reduction": True,
-            "contact_reduction": False,
-        },  # Detection reduction only
-    }
-
-    scenario_results = {}
-
-    for scenario_name, covid_effects in covid_configs.items():
-        # Get the model results
-        bcm = get_bcm(params, covid_effects)
-        spaghetti_res = esamp.model_results_for_samples(idata_extract, bcm).results
-
-        # Filter the results to include only the rows where the index (year) is an integer
-        yearly_data = spaghetti_res.loc[
-            (spaghetti_res.index >= cumulative_start_time)
-            & (spaghetti_res.index % 1 == 0)
-        ]
-
-        # Calculate cumulative sums for each sample
-        cumulative_diseased_yearly = yearly_data["incidence_raw"].cumsum()
-        cumulative_deaths_yearly = yearly_data["mortality_raw"].cumsum()
-
-        # Extract results for specified years
-        cumulative_diseased_results = cumulative_diseased_yearly.loc[years]
-        cumulative_deaths_results = cumulative_deaths_yearly.loc[years]
-
-        # Store the results in the dictionary
-        scenario_results[scenario_name] = {
-            "cumulative_diseased": cumulative_diseased_results,
-            "cumulative_deaths": cumulative_deaths_results,
+    return {
+        scenario_name: {
+            ind: cumulative_results.sel(scenario=matrix_name, indicator=ind).to_pandas().T
+            for ind in cumulative_indicators
         }
-
-    return scenario_results
\ No newline at end of file
+        for scenario_name, matrix_name in scenario_names.items()
+    }
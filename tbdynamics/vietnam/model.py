@@ -1,4 +1,5 @@
-from typing import Dict
+from typing import Dict, List
+import numpy as np
 from summer2 import CompartmentalModel
 from summer2.functions.time import (
     get_sigmoidal_interpolation_function,
@@ -6,7 +7,9 @@ from summer2.functions.time import (
 )
 from summer2.parameters import Parameter, Function, Time
 
-from tbdynamics.tools.utils import triangle_wave_func
+from tbdynamics.tools.utils import triangle_wave_func, get_thinned_output_times
+from tbdynamics.tools.equilibrium import set_equilibrium_population
+from tbdynamics.tools.output_grid import OutputGridModel
 from tbdynamics.tools.inputs import get_birth_rate, get_death_rate, process_death_rate
 from tbdynamics.constants import (
     compartments,
@@ -23,6 +26,11 @@ def build_model(
     covid_effects: Dict[str, bool],
     improved_detection_multiplier: float = None,
     extreme_transmission: bool = False,
+    runtime_detection: bool = False,
+    equilibrium_start: np.ndarray = None,
+    output_step_schedule: Dict[float, float] = None,
+    output_times: List[float] = None,
+    output_profile: str = "full",
 ) -> CompartmentalModel:
     """
     Builds and returns a compartmental model for epidemiological analysis, incorporating
@@ -38,16 +46,39 @@ def build_model(
         time_step: Time step for the model simulation.
         fixed_params: Dictionary of parameters with fixed values.
         matrix: Mixing matrix for age stratification.
+        runtime_detection: Whether the improved detection scale-up is set by model parameters.
+        equilibrium_start: Compartment values at equilibrium_time_start reached by a burn-in run
+            of the model (see get_burn_in_state). If given, the model starts at
+            equilibrium_time_start from the endemic equilibrium found from this state (and with
+            its population size), rather than seeding infection into a susceptible population
+            of start_population_size at time_start.
+        output_step_schedule: Spacing of the model times from each time onwards (e.g.
+            {1800.0: 1.0, 1950.0: 0.1}), thinning the uniform time_step grid on which results
+            are calculated. This is not an integration time step, and can't be used with the
+            fixed-step solvers (see get_thinned_output_times).
+        output_times: Times at which to record the results (e.g. integer years), which must
+            include the target times; results are recorded at every model time if None.
+        output_profile: Set of derived outputs to calculate (see output_profiles).
 
     Returns:
         A configured CompartmentalModel object.
     """
-    model = CompartmentalModel(
-        times=(fixed_params["time_start"], fixed_params["time_end"]),
+    equilibrium_init = equilibrium_start is not None
+    time_start = (
+        fixed_params["equilibrium_time_start"] if equilibrium_init else fixed_params["time_start"]
+    )
+    model = OutputGridModel(
+        times=(time_start, fixed_params["time_end"]),
         compartments=compartments,
         infectious_compartments=infectious_compartments,
         timestep=fixed_params["time_step"],
     )
+    if output_step_schedule:
+        model.times = get_thinned_output_times(
+            time_start, fixed_params["time_end"], output_step_schedule
+        )
+    if output_times is not None:
+        model.set_output_times(output_times)
 
     birth_rates = get_birth_rate()
     death_rates = get_death_rate()
@@ -90,9 +121,12 @@ def build_model(
         fixed_params,
         covid_effects["detection_reduction"],
         improved_detection_multiplier,
+        runtime_detection,
     )
     model.stratify_with(organ_strat)
-    request_model_outputs(model, covid_effects["detection_reduction"])
+    if equilibrium_init:
+        set_equilibrium_population(model, equilibrium_start)
+    request_model_outputs(model, covid_effects["detection_reduction"], output_profile)
     return model
 
 
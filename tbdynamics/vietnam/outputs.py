@@ -13,12 +13,44 @@ from tbdynamics.constants import (
 import numpy as np
 
 
-def request_model_outputs(model: CompartmentalModel, detection_reduction: bool):
+# Derived outputs calculated for each use of the model (all the outputs if None).
+# There is no profile for calibration, as estival's likelihood runner only calculates the
+# target outputs whatever the model's whitelist
+target_outputs = ["total_population", "log_notification", "adults_prevalence_pulmonary"]
+output_profiles = {
+    "scenario": target_outputs
+    + [
+        "notification",
+        "case_notification_rate",
+        "incidence",
+        "incidence_raw",
+        "incidence_early_prop",
+        "incidence_late_prop",
+        "mortality",
+        "mortality_raw",
+        "cumulative_diseased",
+        "cumulative_deaths",
+        "prevalence_smear_positive",
+        "percentage_latent",
+        "detection_rate",
+        *[f"prop_{compartment}" for compartment in compartments],
+    ],
+    "full": None,
+}
+
+
+def request_model_outputs(
+    model: CompartmentalModel,
+    detection_reduction: bool,
+    output_profile: str = "full",
+):
     """
     Requests various model outputs
 
     Args:
         model: The compartmental model from which outputs are requested.
+        output_profile: Key of output_profiles; only the outputs of the profile (and those
+            they depend on) are calculated when the model is run.
     """
     # Request total population size
     total_population = model.request_output_for_compartments(
@@ -188,4 +220,8 @@ def request_model_outputs(model: CompartmentalModel, detection_reduction: bool):
     )
 
     model.add_computed_value_func("detection_rate", detection_func)
-    model.request_computed_value_output("detection_rate")
\ No newline at end of file
+    model.request_computed_value_output("detection_rate")
+
+    profile_outputs = output_profiles[output_profile]
+    if profile_outputs:
+        model.set_derived_outputs_whitelist(profile_outputs)
@@ -0,0 +1,26 @@
+import arviz as az
+import pytest
+
+from tbdynamics.settings import OUT_PATH
+
+VIETNAM_PARAMS = {
+    "start_population_size": 2000000.0,
+    "seed_time": 1805.0,
+    "seed_num": 1.0,
+    "seed_duration": 1.0,
+}
+VIETNAM_COVID_EFFECTS = {"detection_reduction": True, "contact_reduction": False}
+
+
+@pytest.fixture(scope="session")
+def vietnam_bcm():
+    from tbdynamics.vietnam.calibration.utils import get_bcm
+
+    return get_bcm(VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS)
+
+
+@pytest.fixture(scope="session")
+def vietnam_idata():
+    """A few draws of the Vietnam posterior calibrated with the detection reduction."""
+    idata = az.from_netcdf(OUT_PATH / "vietnam/idata/idata_detection.nc")
+    return idata.isel(sample=slice(0, 6))
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+from estival.sampling import tools as esamp
+from estival.sampling.tools import SampleIterator
+
+from tbdynamics.calibration.batch import batch_results_to_df, run_samples_batched
+from tbdynamics.calibration.streaming import StreamingQuantiles, quantiles_for_samples_streamed
+from tbdynamics.calibration.utils import model_results_for_unique_samples
+from tbdynamics.constants import quantiles
+
+INDICATORS = ["incidence", "mortality_raw", "notification"]
+
+
+@pytest.fixture(scope="module")
+def samples(vietnam_bcm, vietnam_idata):
+    return vietnam_bcm.sample.convert(vietnam_idata)
+
+
+@pytest.fixture(scope="module")
+def per_sample_results(vietnam_bcm, samples):
+    return esamp.model_results_for_samples(samples, vietnam_bcm)
+
+
+def test_batched_runs_match_per_sample_runs(vietnam_bcm, samples, per_sample_results):
+    batch_results = run_samples_batched(vietnam_bcm, samples, chunk_size=4, outputs=INDICATORS)
+    assert batch_results.index.equals(samples.index)
+    batched = batch_results_to_df(batch_results)
+    expected = per_sample_results.results[INDICATORS]
+    assert batched.columns.equals(expected.columns)
+    np.testing.assert_allclose(batched.values, expected.values, rtol=1e-6)
+
+
+def test_streamed_quantiles_match_exact_quantiles(vietnam_bcm, samples, per_sample_results):
+    streamed = quantiles_for_samples_streamed(
+        vietnam_bcm, samples, chunk_size=4, outputs=INDICATORS
+    )
+    results = per_sample_results.results[INDICATORS]
+    results.columns = results.columns.remove_unused_levels()
+    expected = esamp.quantiles_for_results(results, quantiles)
+    np.testing.assert_allclose(
+        streamed.values, expected.loc[streamed.index, streamed.columns].values, rtol=1e-6
+    )
+
+
+def test_unique_sample_runs_match_all_runs(vietnam_bcm, samples):
+    # Repeated draws, as where an MCMC proposal was rejected
+    draw_order = [0, 1, 1, 2, 0, 2, 2]
+    repeated = SampleIterator(
+        {k: np.asarray(v)[draw_order] for k, v in samples.components.items()},
+        index=pd.Index(range(len(draw_order)), name="sample"),
+    )
+    unique = model_results_for_unique_samples(repeated, vietnam_bcm)
+    expected = esamp.model_results_for_samples(repeated, vietnam_bcm)
+    pd.testing.assert_frame_equal(unique.results, expected.results)
+    pd.testing.assert_frame_equal(unique.extras, expected.extras)
+
+
+def test_streamed_quantile_sketch():
+    values = np.random.default_rng(0).lognormal(size=(5000, 3, 2))
+    exact = StreamingQuantiles(3, 2, max_exact=10000)
+    sketch = StreamingQuantiles(3, 2, compression=200, max_exact=500)
+    other = StreamingQuantiles(3, 2, compression=200, max_exact=500)
+    for chunk in np.split(values[:4000], 8):
+        exact.update(chunk)
+        sketch.update(chunk)
+    exact.update(values[4000:])
+    other.update(values[4000:])
+    sketch.merge(other)
+
+    expected = np.quantile(values, quantiles, axis=0)
+    np.testing.assert_allclose(exact.get_quantiles(quantiles), expected)
+    assert not sketch.is_exact
+    # Compare in rank: each estimate lies within 1% of the samples of the exact quantile
+    estimates = sketch.get_quantiles(quantiles)
+    ranks = (values[None] <= estimates[:, None]).mean(axis=1)
+    expected_ranks = np.broadcast_to(np.reshape(quantiles, (-1, 1, 1)), ranks.shape)
+    np.testing.assert_allclose(ranks, expected_ranks, atol=0.01)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from tbdynamics.calibration.batch import run_samples_batched
+from tbdynamics.calibration.branching import run_branches_from_snapshot, take_state_snapshots
+from tbdynamics.calibration.utils import get_detection_scaleup_params, set_sample_params
+from tbdynamics.vietnam.calibration.utils import get_bcm
+from conftest import VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS
+
+SNAPSHOT_TIME = 2020.0
+INDICATORS = ["incidence", "mortality_raw", "notification"]
+
+
+def test_branches_match_full_runs(vietnam_idata):
+    bcm = get_bcm(VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS, runtime_detection=True)
+    samples = bcm.sample.convert(vietnam_idata.isel(sample=slice(0, 2)))
+    branch_params = {"baseline": {}, "improved": get_detection_scaleup_params(5.0)}
+
+    snapshot = take_state_snapshots(bcm, samples, SNAPSHOT_TIME)
+    branches = run_branches_from_snapshot(bcm, samples, snapshot, branch_params, INDICATORS)
+    for name, params in branch_params.items():
+        full = run_samples_batched(bcm, set_sample_params(samples, params), outputs=INDICATORS)
+        branch = branches[name]
+        assert branch.outputs == full.outputs
+        assert branch.times.equals(full.times)
+        # Restarting the adaptive solver (with rtol 1.4e-4) from the snapshot changes its steps
+        after_snapshot = np.asarray(full.times >= SNAPSHOT_TIME)
+        np.testing.assert_allclose(
+            branch.values[:, after_snapshot], full.values[:, after_snapshot], rtol=1e-3
+        )
+    assert not np.allclose(branches["improved"].values, branches["baseline"].values, rtol=1e-3)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pymc.backends.ndarray import NDArray
+from estival import priors as esp
+from estival import targets as est
+from estival.model import BayesianCompartmentalModel
+from summer2 import CompartmentalModel
+from summer2.parameters import Parameter
+
+from tbdynamics.calibration.checkpoint import sample_with_checkpoints
+
+SAMPLING_KWARGS = {
+    "draws": 8,
+    "tune": 8,
+    "chains": 2,
+    "initvals": {"contact_rate": 0.5, "recovery_rate": 0.2},
+    "random_seed": 3,
+    "checkpoint_every": 5,
+    "cores": 1,
+}
+
+
+class Interruption(Exception):
+    pass
+
+
+def get_sir_bcm() -> BayesianCompartmentalModel:
+    model = CompartmentalModel(
+        times=(0.0, 50.0),
+        compartments=["S", "I", "R"],
+        infectious_compartments=["I"],
+        timestep=1.0,
+    )
+    model.set_initial_population({"S": 990.0, "I": 10.0})
+    model.add_infection_frequency_flow("infection", Parameter("contact_rate"), "S", "I")
+    model.add_transition_flow("recovery", Parameter("recovery_rate"), "I", "R")
+    model.request_output_for_compartments("infectious", ["I"])
+    priors = [
+        esp.UniformPrior("contact_rate", (0.1, 1.0)),
+        esp.UniformPrior("recovery_rate", (0.05, 0.5)),
+    ]
+    targets = [
+        est.NormalTarget("infectious", pd.Series([120.0, 60.0, 20.0], index=[10.0, 20.0, 30.0]), 10.0)
+    ]
+    return BayesianCompartmentalModel(
+        model, {"contact_rate": 0.5, "recovery_rate": 0.2}, priors, targets
+    )
+
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path, monkeypatch):
+    full = sample_with_checkpoints(get_sir_bcm, tmp_path / "full", **SAMPLING_KWARGS)
+
+    # Interrupt the second run part of the way through the first chain, after its first
+    # two checkpoints
+    record = NDArray.record
+    n_recorded = [0]
+
+    def interrupted_record(self, point, stats=None):
+        n_recorded[0] += 1
+        if n_recorded[0] == 13:
+            raise Interruption
+        return record(self, point, stats)
+
+    monkeypatch.setattr(NDArray, "record", interrupted_record)
+    with pytest.raises(Interruption):
+        sample_with_checkpoints(get_sir_bcm, tmp_path / "resumed", **SAMPLING_KWARGS)
+    monkeypatch.setattr(NDArray, "record", record)
+    assert not (tmp_path / "resumed" / "chain_1.npz").exists()
+
+    resumed = sample_with_checkpoints(get_sir_bcm, tmp_path / "resumed", **SAMPLING_KWARGS)
+    assert resumed.posterior.sizes["chain"] == 2
+    assert resumed.posterior.sizes["draw"] == SAMPLING_KWARGS["draws"]
+    assert resumed.warmup_posterior.sizes["draw"] == SAMPLING_KWARGS["tune"]
+    for group in ["posterior", "warmup_posterior", "sample_stats", "warmup_sample_stats"]:
+        for name, values in full[group].items():
+            np.testing.assert_array_equal(resumed[group][name].values, values.values)
+
+
+def test_changed_run_config_is_rejected(tmp_path):
+    sample_with_checkpoints(get_sir_bcm, tmp_path, **SAMPLING_KWARGS)
+    with pytest.raises(ValueError, match="different run"):
+        sample_with_checkpoints(get_sir_bcm, tmp_path, **SAMPLING_KWARGS | {"draws": 10})
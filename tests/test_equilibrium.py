@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from tbdynamics.vietnam.calibration.utils import get_bcm
+from conftest import VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS
+
+
+@pytest.fixture(scope="module")
+def draw(vietnam_bcm, vietnam_idata):
+    samples = vietnam_bcm.sample.convert(vietnam_idata)
+    return {k: float(v[0]) for k, v in samples.components.items()}
+
+
+def test_equilibrium_start_matches_burn_in(vietnam_bcm, draw):
+    equilibrium_bcm = get_bcm(
+        VIETNAM_PARAMS,
+        VIETNAM_COVID_EFFECTS,
+        equilibrium_init=True,
+        equilibrium_reference=draw,
+    )
+    burn_in = vietnam_bcm.run(draw)
+    equilibrium = equilibrium_bcm.run(draw)
+    for target in vietnam_bcm.targets.values():
+        target_times = target.data.index
+        expected = burn_in.derived_outputs[target.model_key].loc[target_times]
+        modelled = equilibrium.derived_outputs[target.model_key].loc[target_times]
+        np.testing.assert_allclose(modelled, expected, rtol=1e-4, err_msg=target.model_key)
+    assert equilibrium.extras["loglikelihood"] == pytest.approx(
+        burn_in.extras["loglikelihood"], abs=0.01
+    )
@@ -0,0 +1,55 @@
+import json
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+# Inference and plotting packages that the model-building path should not import
+# (summer2 itself already imports plotly and scipy)
+HEAVY_MODULES = ["matplotlib", "arviz", "xarray", "estival", "pymc", "numpyro", "nevergrad"]
+
+MODEL_MODULES = [
+    "tbdynamics.vietnam.model",
+    "tbdynamics.camau.model",
+    "tbdynamics.tools.inputs",
+]
+
+# Maximum import time in seconds, taken as the fastest of several fresh imports so that
+# disk caching doesn't count against it
+IMPORT_BUDGET = 2.0
+N_REPEATS = 3
+
+
+def measure_import(module_name: str) -> Dict[str, any]:
+    """
+    Measures the time to import a module in a fresh interpreter, as a worker process would.
+
+    Args:
+        module_name: The module to import.
+
+    Returns:
+        The import time in seconds and the heavy modules that were imported with it.
+    """
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module_name}\n"
+        "duration = time.perf_counter() - start\n"
+        f"loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'seconds': duration, 'heavy_modules': loaded}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module_name", MODEL_MODULES)
+def test_import_budget(module_name):
+    measurements = [measure_import(module_name) for _ in range(N_REPEATS)]
+    seconds = min(m["seconds"] for m in measurements)
+    assert seconds <= IMPORT_BUDGET, f"{module_name} took {seconds:.2f}s to import"
+    assert not measurements[0]["heavy_modules"], (
+        f"{module_name} imported {measurements[0]['heavy_modules']}"
+    )
@@ -0,0 +1,73 @@
+import arviz as az
+import numpy as np
+import pytest
+
+from tbdynamics.settings import OUT_PATH
+from tbdynamics.calibration.likelihood import (
+    calculate_pointwise_loglikelihood,
+    get_loglikelihood_idata,
+    get_observation_weights,
+    get_target_times,
+)
+from tbdynamics.vietnam.calibration.utils import get_bcm
+from conftest import VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS
+
+# Enough draws for the Pareto tail fits of LOO
+N_LOO_DRAWS = 100
+
+
+@pytest.fixture(scope="module")
+def loo_draws():
+    idata = az.from_netcdf(OUT_PATH / "vietnam/idata/idata_detection.nc")
+    return idata.isel(sample=slice(0, N_LOO_DRAWS))
+
+
+@pytest.fixture(scope="module")
+def pointwise_results(vietnam_bcm, loo_draws):
+    return calculate_pointwise_loglikelihood(vietnam_bcm, loo_draws, chunk_size=50)
+
+
+def test_weighted_pointwise_sum_matches_loglikelihood(vietnam_bcm, loo_draws, pointwise_results):
+    pointwise_ll, ll_res = pointwise_results
+    weights = get_observation_weights(vietnam_bcm)
+    samples = vietnam_bcm.sample.convert(loo_draws)
+    for i in range(3):
+        params = {k: float(v[i]) for k, v in samples.components.items()}
+        expected = vietnam_bcm.loglikelihood(**params)
+        weighted = sum(pointwise_ll[name][i] @ weights[name] for name in vietnam_bcm.targets)
+        assert weighted == pytest.approx(expected, abs=1e-6)
+        assert ll_res["loglikelihood"].iloc[i] == pytest.approx(expected, abs=1e-6)
+
+
+def test_loo_on_unweighted_log_densities(vietnam_bcm, pointwise_results):
+    pointwise_ll, ll_res = pointwise_results
+    ll_idata = get_loglikelihood_idata(vietnam_bcm, pointwise_ll, ll_res)
+    stored = ll_idata.log_likelihood["loglikelihood"].values.reshape(N_LOO_DRAWS, -1)
+    expected = np.concatenate([pointwise_ll[name] for name in vietnam_bcm.targets], axis=1)
+    np.testing.assert_array_equal(stored, expected)
+
+    loo = az.loo(ll_idata, pointwise=True)
+    assert np.isfinite(loo.elpd_loo)
+    assert np.all(loo.pareto_k.values < 1.0)
+
+
+def test_target_loglikelihoods_match_full_run(vietnam_bcm, loo_draws, pointwise_results):
+    _, ll_res = pointwise_results
+    samples = vietnam_bcm.sample.convert(loo_draws)
+    params = {k: float(v[0]) for k, v in samples.components.items()}
+    ll_components = vietnam_bcm.run(params, include_outputs=False).extras["ll_components"]
+    for name, expected in ll_components.items():
+        assert ll_res[f"ll_{name}"].iloc[0] == pytest.approx(float(expected), abs=1e-6)
+
+
+def test_likelihood_only_model_matches_full_model(vietnam_bcm, loo_draws):
+    likelihood_bcm = get_bcm(VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS, likelihood_only=True)
+    samples = vietnam_bcm.sample.convert(loo_draws)
+    params = {k: float(v[0]) for k, v in samples.components.items()}
+    results = likelihood_bcm.run(params)
+    target_keys = [target.model_key for target in vietnam_bcm.targets.values()]
+    assert sorted(results.derived_outputs.columns) == sorted(target_keys)
+    assert list(results.derived_outputs.index) == get_target_times(vietnam_bcm.targets.values())
+    assert results.extras["loglikelihood"] == pytest.approx(
+        vietnam_bcm.loglikelihood(**params), abs=1e-6
+    )
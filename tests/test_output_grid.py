@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from tbdynamics.tools.output_grid import OutputGridModel
+from tbdynamics.tools.utils import get_thinned_output_times
+
+
+def build_sir_model(output_step_schedule=None) -> OutputGridModel:
+    model = OutputGridModel(
+        times=(1900.0, 2000.0),
+        compartments=["S", "I", "R"],
+        infectious_compartments=["I"],
+        timestep=0.5,
+    )
+    if output_step_schedule:
+        model.times = get_thinned_output_times(1900.0, 2000.0, output_step_schedule)
+    model.set_initial_population({"S": 990.0, "I": 10.0})
+    model.add_infection_frequency_flow("infection", 0.5, "S", "I")
+    model.add_transition_flow("recovery", 0.2, "I", "R")
+    model.request_output_for_compartments("infectious", ["I"])
+    return model
+
+
+def test_thinned_output_times():
+    times = get_thinned_output_times(1900.0, 2000.0, {1800.0: 10.0, 1980.0: 0.5})
+    expected = np.concatenate([np.arange(1900.0, 1980.0, 10.0), np.arange(1980.0, 2000.5, 0.5)])
+    np.testing.assert_allclose(times, expected)
+
+
+def test_thinned_grid_matches_uniform_grid():
+    schedule = {1900.0: 5.0, 1990.0: 0.5}
+    uniform_model, thinned_model = build_sir_model(), build_sir_model(schedule)
+    uniform_model.run()
+    thinned_model.run()
+    uniform = uniform_model.get_derived_outputs_df()["infectious"]
+    thinned = thinned_model.get_derived_outputs_df()["infectious"]
+    np.testing.assert_allclose(thinned, uniform.loc[thinned.index], rtol=1e-4)
+
+
+def test_fixed_step_solver_rejects_thinned_grid():
+    model = build_sir_model({1900.0: 5.0, 1990.0: 0.5})
+    with pytest.raises(ValueError, match="output grid has been thinned"):
+        model.get_runner({}, solver="euler")
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from tbdynamics.calibration.results_store import (
+    list_scenarios,
+    load_quantile_outputs,
+    load_scenario_results,
+    write_scenario_results,
+)
+
+INDICATORS = ["incidence", "notification", "mortality_raw"]
+TIMES = np.arange(2000.0, 2011.0)
+
+
+def get_scenario_results(scenarios, seed) -> xr.DataArray:
+    samples = pd.MultiIndex.from_product([[0, 1], [0, 1, 2]], names=["chain", "draw"])
+    values = np.random.default_rng(seed).random((len(scenarios), len(samples), len(TIMES), 3))
+    return xr.DataArray(
+        values,
+        coords={"scenario": scenarios, "sample": samples, "time": TIMES, "indicator": INDICATORS},
+        dims=["scenario", "sample", "time", "indicator"],
+    )
+
+
+def test_results_store_roundtrip(tmp_path):
+    store_path = tmp_path / "results.nc"
+    first = get_scenario_results(["zeta", "alpha"], 0)
+    second = get_scenario_results(["mid"], 1)
+    write_scenario_results(first, store_path)
+    write_scenario_results(second, store_path)
+
+    # Scenarios keep the order they were written in, rather than HDF5's order by name
+    assert list_scenarios(store_path) == ["zeta", "alpha", "mid"]
+
+    expected = xr.concat([first, second], dim="scenario")
+    loaded = load_scenario_results(store_path)
+    assert list(loaded["scenario"].values) == ["zeta", "alpha", "mid"]
+    assert loaded.indexes["sample"].equals(expected.indexes["sample"])
+    np.testing.assert_array_equal(loaded.values, expected.values)
+
+    subset = load_scenario_results(store_path, ["mid"], ["notification"], (2003.0, 2005.0))
+    np.testing.assert_array_equal(
+        subset.values,
+        second.sel(indicator=["notification"], time=slice(2003.0, 2005.0)).values,
+    )
+
+    quantile_outputs = load_quantile_outputs(store_path, "alpha", ["incidence"])
+    expected_quantiles = first.sel(scenario="alpha", indicator="incidence").quantile(
+        quantile_outputs["incidence"].columns.tolist(), dim="sample"
+    )
+    np.testing.assert_allclose(quantile_outputs["incidence"].values, expected_quantiles.values.T)
+
+
+def test_results_store_rejects_existing_scenarios(tmp_path):
+    store_path = tmp_path / "results.nc"
+    write_scenario_results(get_scenario_results(["alpha"], 0), store_path)
+    with pytest.raises(ValueError, match="alpha"):
+        write_scenario_results(get_scenario_results(["alpha"], 1), store_path)
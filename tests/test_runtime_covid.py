@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from estival.sampling import tools as esamp
+
+from tbdynamics.calibration.utils import set_sample_params
+from tbdynamics.vietnam.calibration.utils import (
+    get_bcm,
+    get_covid_switch_params,
+    set_config_logprior,
+)
+from conftest import VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS
+
+
+def test_runtime_covid_matches_configuration_model(vietnam_bcm, vietnam_idata):
+    runtime_bcm = get_bcm(VIETNAM_PARAMS, runtime_covid=True)
+    samples = vietnam_bcm.sample.convert(vietnam_idata.isel(sample=slice(0, 3)))
+    switched_samples = set_sample_params(
+        runtime_bcm.sample.convert(samples), get_covid_switch_params(VIETNAM_COVID_EFFECTS)
+    )
+
+    runtime = esamp.model_results_for_samples(switched_samples, runtime_bcm)
+    expected = esamp.model_results_for_samples(samples, vietnam_bcm)
+    outputs = list(expected.results.columns.unique("variable"))
+    np.testing.assert_allclose(
+        runtime.results[outputs].values, expected.results[outputs].values, rtol=1e-6
+    )
+
+    ll_res = set_config_logprior(runtime.extras, switched_samples, VIETNAM_COVID_EFFECTS)
+    columns = ["logposterior", "logprior", "loglikelihood"]
+    pd.testing.assert_frame_equal(ll_res[columns], expected.extras[columns], rtol=1e-6)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from tbdynamics.calibration.scenarios import run_scenario_matrix
+from tbdynamics.calibration.utils import model_results_for_unique_samples, set_sample_params
+from tbdynamics.vietnam.calibration.utils import get_bcm, get_scenario_specs
+from conftest import VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS
+
+MULTIPLIER = 5.0
+INDICATORS = ["incidence", "mortality_raw", "notification"]
+
+
+@pytest.fixture(scope="module")
+def runtime_bcm():
+    return get_bcm(VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS, runtime_detection=True)
+
+
+def test_runtime_detection_keeps_the_priors(vietnam_bcm, runtime_bcm, vietnam_idata):
+    assert list(runtime_bcm.priors) == list(vietnam_bcm.priors)
+    samples = vietnam_bcm.sample.convert(vietnam_idata)
+    params = {k: float(v[0]) for k, v in samples.components.items()}
+    assert runtime_bcm.logprior(**params) == vietnam_bcm.logprior(**params)
+    assert runtime_bcm.loglikelihood(**params) == pytest.approx(
+        vietnam_bcm.loglikelihood(**params), abs=1e-6
+    )
+
+
+def test_calibrate_detection_requires_runtime_detection():
+    with pytest.raises(ValueError, match="runtime_detection"):
+        get_bcm(VIETNAM_PARAMS, VIETNAM_COVID_EFFECTS, calibrate_detection=True)
+
+
+def test_runtime_detection_matches_built_in_multiplier(vietnam_idata):
+    idata = vietnam_idata.isel(sample=slice(0, 2))
+    runtime_specs = get_scenario_specs(["detection"], [MULTIPLIER], runtime_detection=True)
+    built_in_specs = get_scenario_specs([], [MULTIPLIER])
+    runtime = run_scenario_matrix(get_bcm, VIETNAM_PARAMS, idata, runtime_specs, INDICATORS)
+    built_in = run_scenario_matrix(get_bcm, VIETNAM_PARAMS, idata, built_in_specs, INDICATORS)
+
+    scenario = built_in_specs[0].name
+    np.testing.assert_allclose(
+        runtime.sel(scenario=scenario).values, built_in.sel(scenario=scenario).values, rtol=1e-4
+    )
+    # The improvement only starts in 2025, so it is off in the baseline scenario
+    baseline = runtime.sel(scenario="detection")
+    improved = runtime.sel(scenario=scenario)
+    np.testing.assert_allclose(
+        improved.sel(time=slice(None, 2025.0)).values,
+        baseline.sel(time=slice(None, 2025.0)).values,
+        rtol=1e-4,
+    )
+    assert (improved.sel(time=2035.0, indicator="notification") > 0).all()
+    assert not np.allclose(
+        improved.sel(time=2035.0).values, baseline.sel(time=2035.0).values, rtol=1e-3
+    )
+
+
+def test_per_sample_runner_rejects_runtime_params(runtime_bcm, vietnam_idata):
+    samples = set_sample_params(
+        runtime_bcm.sample.convert(vietnam_idata), {"improved_detection_multiplier": MULTIPLIER}
+    )
+    with pytest.raises(ValueError, match="improved_detection_multiplier"):
+        model_results_for_unique_samples(samples, runtime_bcm)